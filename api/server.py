@@ -0,0 +1,226 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile, BackgroundTasks
+from fastapi.responses import StreamingResponse, PlainTextResponse, FileResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from app.config import ALLOWED_EXTENSIONS, RAG_CONTEXT_SIZE, SNAPSHOT_QUANTIZE, JOB_RETENTION_MINUTES, CLEANUP_INTERVAL_MINUTES
+from app.logger import logger
+from app.metrics import render_prometheus, start_metrics_exporters
+from app.services.ingestion_service import ingest_file
+from app.services.search_service import search_documents, build_context_text
+from app.services.llm_service import get_rag_answer, stream_rag_answer
+from app.services.quota_service import quota_stats
+from app.services.snapshot_service import export_session_snapshot, restore_session_snapshot
+from app.services.vector_service import ensure_collection, delete_session_data, update_last_activity, get_session_filenames, perform_global_cleanup
+
+# --- Ingest Job Registry ---
+# Jobs live in the memory of the worker that accepted the upload, so job status
+# requests must reach the same worker (sticky sessions behind a load balancer).
+
+JOBS = {}
+_jobs_lock = threading.Lock()
+
+def _update_job(job_id, **fields):
+    with _jobs_lock:
+        JOBS[job_id].update(fields)
+
+def _prune_jobs():
+    """Drop finished jobs older than JOB_RETENTION_MINUTES. Must be called with _jobs_lock held."""
+    cutoff = time.time() - JOB_RETENTION_MINUTES * 60
+    expired = [job_id for job_id, job in JOBS.items() if job.get("finished_at") and job["finished_at"] < cutoff]
+    for job_id in expired:
+        del JOBS[job_id]
+
+def _spool_upload(upload, file_ext):
+    """Copy an upload to a temporary file in chunks, so large files never sit in memory whole."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_ext}") as tmp_file:
+        shutil.copyfileobj(upload.file, tmp_file)
+        return tmp_file.name
+
+def _remove_spooled(uploads):
+    for _, path in uploads:
+        if os.path.exists(path):
+            os.remove(path)
+
+def run_ingest_job(job_id, session_id, uploads, process_images):
+    """Ingest every uploaded file of a job, recording progress as it goes."""
+    _update_job(job_id, status="running", started_at=time.time())
+    try:
+        for filename, path in uploads:
+            chunk_count = ingest_file(path, filename, session_id, process_images=process_images)
+            with _jobs_lock:
+                JOBS[job_id]["files_done"].append({"filename": filename, "chunks": chunk_count})
+        update_last_activity(session_id)
+        _update_job(job_id, status="completed", finished_at=time.time())
+    except Exception as e:
+        logger.error(f"Ingest job {job_id} failed: {str(e)}")
+        _update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+    finally:
+        _remove_spooled(uploads)
+
+# --- App ---
+
+async def _cleanup_loop():
+    """Purge expired sessions periodically, as long-running workers never restart on their own"""
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL_MINUTES * 60)
+        try:
+            await asyncio.to_thread(perform_global_cleanup)
+        except Exception as e:
+            logger.error(f"Periodic cleanup failed: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app):
+    start_metrics_exporters()
+    await asyncio.to_thread(ensure_collection)
+    await asyncio.to_thread(perform_global_cleanup)
+    cleanup_task = asyncio.create_task(_cleanup_loop())
+    yield
+    cleanup_task.cancel()
+
+app = FastAPI(title="Document Search API", lifespan=lifespan)
+
+class SearchRequest(BaseModel):
+    query: str
+    limit: int = 10
+
+class AnswerRequest(BaseModel):
+    query: str
+    limit: int = 10
+    stream: bool = False
+
+def _serialize_result(res):
+    return {
+        "id": str(res.id),
+        "score": res.score,
+        "filename": res.payload.get("filename"),
+        "source_type": res.payload.get("source_type"),
+        "document": res.payload.get("document", ""),
+    }
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/quota")
+async def quota():
+    return quota_stats()
+
+@app.post("/sessions")
+async def create_session():
+    return {"session_id": str(uuid.uuid4())}
+
+@app.post("/sessions/{session_id}/documents", status_code=202)
+async def upload_documents(session_id: uuid.UUID, background_tasks: BackgroundTasks, files: List[UploadFile] = File(...), process_images: bool = Form(True)):
+    extensions = []
+    for upload in files:
+        file_ext = upload.filename.rsplit('.', 1)[-1].lower() if '.' in upload.filename else ''
+        if file_ext not in ALLOWED_EXTENSIONS:
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {upload.filename}")
+        extensions.append(file_ext)
+
+    uploads = []
+    try:
+        for upload, file_ext in zip(files, extensions):
+            uploads.append((upload.filename, await asyncio.to_thread(_spool_upload, upload, file_ext)))
+    except Exception:
+        _remove_spooled(uploads)
+        raise
+
+    job_id = str(uuid.uuid4())
+    with _jobs_lock:
+        _prune_jobs()
+        JOBS[job_id] = {
+            "job_id": job_id,
+            "session_id": str(session_id),
+            "status": "queued",
+            "files": [filename for filename, _ in uploads],
+            "files_done": [],
+            "created_at": time.time(),
+        }
+    background_tasks.add_task(run_ingest_job, job_id, str(session_id), uploads, process_images)
+    logger.info(f"Queued ingest job {job_id} with {len(uploads)} file(s) for session {session_id}")
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    with _jobs_lock:
+        job = JOBS.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return dict(job, files_done=list(job["files_done"]))
+
+@app.get("/sessions/{session_id}/documents")
+async def list_documents(session_id: uuid.UUID):
+    filenames = await asyncio.to_thread(get_session_filenames, str(session_id))
+    return {"session_id": str(session_id), "filenames": filenames}
+
+@app.post("/sessions/{session_id}/search")
+async def search(session_id: uuid.UUID, request: SearchRequest):
+    results = await asyncio.to_thread(search_documents, request.query, str(session_id), request.limit)
+    await asyncio.to_thread(update_last_activity, str(session_id))
+    return {"results": [_serialize_result(res) for res in results]}
+
+@app.post("/sessions/{session_id}/answer")
+async def answer(session_id: uuid.UUID, request: AnswerRequest):
+    results = await asyncio.to_thread(search_documents, request.query, str(session_id), request.limit)
+    await asyncio.to_thread(update_last_activity, str(session_id))
+    context_text = build_context_text(results)
+
+    if request.stream:
+        # Starlette iterates sync generators in its threadpool, keeping the event loop free
+        return StreamingResponse(stream_rag_answer(request.query, context_text, str(session_id)), media_type="text/plain")
+
+    answer_text = await asyncio.to_thread(get_rag_answer, request.query, context_text, str(session_id))
+    return {
+        "answer": answer_text,
+        "context": [_serialize_result(res) for res in results[:RAG_CONTEXT_SIZE]],
+    }
+
+@app.get("/sessions/{session_id}/snapshot")
+async def download_snapshot(session_id: uuid.UUID, quantize: bool = SNAPSHOT_QUANTIZE):
+    fd, snapshot_path = tempfile.mkstemp(suffix=".snapshot.zip")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(export_session_snapshot, str(session_id), snapshot_path, quantize)
+    except Exception as e:
+        os.remove(snapshot_path)
+        raise HTTPException(status_code=500, detail=f"Failed to export snapshot: {str(e)}")
+    return FileResponse(
+        snapshot_path,
+        media_type="application/zip",
+        filename=f"session-{session_id}.snapshot.zip",
+        background=BackgroundTask(os.remove, snapshot_path),
+    )
+
+@app.post("/sessions/{session_id}/snapshot")
+async def upload_snapshot(session_id: uuid.UUID, file: UploadFile = File(...)):
+    try:
+        _, restored = await asyncio.to_thread(restore_session_snapshot, file.file, str(session_id))
+    except (ValueError, KeyError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid snapshot: {str(e)}")
+    except Exception as e:
+        logger.error(f"Snapshot restore into session {session_id} failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to restore snapshot: {str(e)}")
+    return {"session_id": str(session_id), "points": restored}
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: uuid.UUID):
+    try:
+        await asyncio.to_thread(delete_session_data, str(session_id))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete session data: {str(e)}")
+    return {"session_id": str(session_id), "deleted": True}
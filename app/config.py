@@ -1,25 +1,65 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
+def _int_env(name, default=None):
+    """Read an integer env var without failing at import time when it is missing"""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return int(value)
+
+def _float_env(name, default=None):
+    """Read a float env var without failing at import time when it is missing"""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return float(value)
+
+def _bool_env(name, default=False):
+    """Read a boolean env var such as 'true'/'false' or '1'/'0'"""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
 # Embedding Configuration
-EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM"))
+EMBEDDING_DIM = _int_env("EMBEDDING_DIM")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # Text Processing Configuration
-CHUNK_SIZE = int(os.getenv("CHUNK_SIZE"))
-CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP"))
-RAG_CONTEXT_SIZE = int(os.getenv("RAG_CONTEXT_SIZE"))
+CHUNK_SIZE = _int_env("CHUNK_SIZE", 1000)
+CHUNK_OVERLAP = _int_env("CHUNK_OVERLAP", 100)
+RAG_CONTEXT_SIZE = _int_env("RAG_CONTEXT_SIZE", 5)
+UPSERT_BATCH_SIZE = _int_env("UPSERT_BATCH_SIZE", 64)
+
+# OCR Configuration (scanned PDF pages without a text layer)
+OCR_ENABLED = _bool_env("OCR_ENABLED", True)
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+OCR_WORKERS = _int_env("OCR_WORKERS", os.cpu_count() or 1)
+OCR_MIN_TEXT_CHARS = _int_env("OCR_MIN_TEXT_CHARS", 20)
+OCR_MIN_DPI = _int_env("OCR_MIN_DPI", 150)
+OCR_MAX_DPI = _int_env("OCR_MAX_DPI", 400)
+OCR_DEFAULT_DPI = _int_env("OCR_DEFAULT_DPI", 300)
+# A scanned page skips the vision model only if at most this share of its ink lies outside
+# words recognized with at least OCR_TEXT_ONLY_MIN_CONFIDENCE (i.e. it has no figures)
+OCR_TEXT_ONLY_MAX_FIGURE_INK = _float_env("OCR_TEXT_ONLY_MAX_FIGURE_INK", 0.05)
+OCR_TEXT_ONLY_MIN_CONFIDENCE = _int_env("OCR_TEXT_ONLY_MIN_CONFIDENCE", 60)
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "docsearch_ocr_cache"))
 
 # Qdrant Configuration
+# QDRANT_URL may also be ":memory:" for an in-process store, or QDRANT_PATH a local on-disk store
 QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_PATH = os.getenv("QDRANT_PATH")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION")
 
 # Model Configuration
 IMAGE_MODEL = os.getenv("IMAGE_MODEL")
+IMAGE_REQUEST_DELAY_SECONDS = _float_env("IMAGE_REQUEST_DELAY_SECONDS", 4.0)
 RAG_MODEL = os.getenv("RAG_MODEL")
 
 # Prompt Configuration
@@ -27,7 +67,40 @@ LLM_IMAGE_PROMPT = os.getenv("IMAGE_PROMPT")
 
 RAG_SYSTEM_PROMPT = os.getenv("RAG_SYSTEM_PROMPT")
 
+# Snapshot Configuration (session export/restore without re-embedding)
+SNAPSHOT_BATCH_SIZE = _int_env("SNAPSHOT_BATCH_SIZE", 1000)
+SNAPSHOT_RESTORE_WORKERS = _int_env("SNAPSHOT_RESTORE_WORKERS", 4)
+SNAPSHOT_QUANTIZE = _bool_env("SNAPSHOT_QUANTIZE", False)
+
 # App UI Configuration
 UPLOAD_FOLDER = 'files'
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'csv', 'xlsx'}
-STORAGE_TIMEOUT_MINUTES = int(os.getenv("STORAGE_TIMEOUT_MINUTES"))
+STORAGE_TIMEOUT_MINUTES = _int_env("STORAGE_TIMEOUT_MINUTES", 60)
+
+# API Configuration
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = _int_env("API_PORT", 8000)
+API_WORKERS = _int_env("API_WORKERS", 1)
+JOB_RETENTION_MINUTES = _int_env("JOB_RETENTION_MINUTES", 60)
+CLEANUP_INTERVAL_MINUTES = _int_env("CLEANUP_INTERVAL_MINUTES", 5)
+
+def require_config(**settings):
+    """Raise a clear error for required settings that are missing from the environment"""
+    missing = [name for name, value in settings.items() if value is None]
+    if missing:
+        raise ValueError(f"Missing required configuration: {', '.join(missing)}. Please set them in your .env file.")
+
+# Metrics Configuration (Prometheus text format, disabled by default)
+METRICS_ENABLED = _bool_env("METRICS_ENABLED", False)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = _int_env("METRICS_PORT")
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_FILE_INTERVAL_SECONDS = _int_env("METRICS_FILE_INTERVAL_SECONDS", 15)
+
+# Provider Quota Scheduler (all sessions share one API key)
+QUOTA_SCHEDULER_ENABLED = _bool_env("QUOTA_SCHEDULER_ENABLED", True)
+QUOTA_MAX_CONCURRENCY = _int_env("QUOTA_MAX_CONCURRENCY", 8)
+QUOTA_INTERACTIVE_RESERVE = _int_env("QUOTA_INTERACTIVE_RESERVE", 2)
+QUOTA_REQUESTS_PER_MINUTE = _int_env("QUOTA_REQUESTS_PER_MINUTE", 0)
+QUOTA_BURST = _int_env("QUOTA_BURST", 0)
+QUOTA_STATE_FILE = os.getenv("QUOTA_STATE_FILE")
@@ -0,0 +1,204 @@
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT, METRICS_FILE, METRICS_FILE_INTERVAL_SECONDS
+from app.logger import logger
+
+# Latency buckets in seconds, from fast Qdrant lookups to slow vision calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    "docsearch_stage_seconds": ("histogram", "Duration of ingest and query pipeline stages"),
+    "docsearch_provider_call_seconds": ("histogram", "Latency of individual model provider calls"),
+    "docsearch_tokens_total": ("counter", "Tokens reported by model provider responses"),
+    "docsearch_retries_total": ("counter", "Retried model provider calls"),
+    "docsearch_cache_hits_total": ("counter", "Cache lookups that were served from the cache"),
+    "docsearch_cache_misses_total": ("counter", "Cache lookups that missed"),
+    "docsearch_zero_vector_fallbacks_total": ("counter", "Embeddings replaced by a zero vector after a provider error"),
+    "docsearch_points_upserted_total": ("counter", "Points written to Qdrant"),
+    "docsearch_quota_queue_depth": ("gauge", "Provider calls waiting in the quota scheduler"),
+    "docsearch_quota_wait_seconds": ("histogram", "Time provider calls waited in the quota scheduler"),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_exporters_started = False
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, value=1, **labels):
+    """Increment a counter"""
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to its current value"""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name, value, **labels):
+    """Record a value in a histogram"""
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(DEFAULT_BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+class _Span:
+    """Times a block and records it in a histogram"""
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(stage, **labels):
+    """Time a pipeline stage: `with span("embed"): ...`. Returns a shared no-op when metrics are disabled."""
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return _Span("docsearch_stage_seconds", dict(labels, stage=stage))
+
+def record_stage(stage, seconds, **labels):
+    """Record a stage timed by hand, for stages interleaved with others that a single span cannot wrap"""
+    observe("docsearch_stage_seconds", seconds, **dict(labels, stage=stage))
+
+def provider_call(call, model=None):
+    """Time a single model provider call, labelled by call type and model"""
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return _Span("docsearch_provider_call_seconds", {"call": call, "model": model or "unknown"})
+
+def record_usage(call, usage):
+    """Count prompt/completion tokens from a provider usage block"""
+    if not METRICS_ENABLED or not usage:
+        return
+    try:
+        for kind in ("prompt_tokens", "completion_tokens"):
+            tokens = usage.get(kind)
+            if isinstance(tokens, (int, float)):
+                inc("docsearch_tokens_total", tokens, call=call, kind=kind.replace("_tokens", ""))
+    except Exception as e:
+        # Metrics must never break a provider call
+        logger.debug(f"Could not record token usage for {call}: {e}")
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {key: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]} for key, h in _histograms.items()}
+
+    lines = []
+    names = sorted({name for name, _ in counters} | {name for name, _ in gauges} | {name for name, _ in histograms})
+    for name in names:
+        metric_type, help_text = METRIC_HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for (metric_name, labels), value in sorted(counters.items()) + sorted(gauges.items()):
+            if metric_name == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (metric_name, labels), histogram in sorted(histograms.items()):
+            if metric_name != name:
+                continue
+            for bound, count in zip(DEFAULT_BUCKETS, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(labels, {'le': bound})} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+def write_metrics_file(path=METRICS_FILE):
+    """Atomically write the current metrics to a file (e.g. for the node_exporter textfile collector)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def _file_writer_loop():
+    while True:
+        try:
+            write_metrics_file()
+        except Exception as e:
+            logger.warning(f"Failed to write metrics file {METRICS_FILE}: {e}")
+        time.sleep(METRICS_FILE_INTERVAL_SECONDS)
+
+def start_metrics_exporters():
+    """Start the configured exporters (local /metrics endpoint and/or metrics file) once per process"""
+    global _exporters_started
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+    if METRICS_PORT:
+        try:
+            server = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Serving Prometheus metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            # Another worker process may already own the port
+            logger.warning(f"Could not start metrics endpoint on port {METRICS_PORT}: {e}")
+    if METRICS_FILE:
+        threading.Thread(target=_file_writer_loop, name="metrics-file", daemon=True).start()
+        logger.info(f"Writing Prometheus metrics to {METRICS_FILE} every {METRICS_FILE_INTERVAL_SECONDS}s")
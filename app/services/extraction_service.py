@@ -1,9 +1,235 @@
+import os
 import csv
-import PyPDF2
-from openpyxl import load_workbook
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from app.config import CHUNK_SIZE, CHUNK_OVERLAP
+import json
+import hashlib
+import threading
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from app.config import CHUNK_SIZE, CHUNK_OVERLAP, OCR_ENABLED, OCR_LANGUAGE, OCR_WORKERS, OCR_MIN_TEXT_CHARS, OCR_MIN_DPI, OCR_MAX_DPI, OCR_DEFAULT_DPI, OCR_CACHE_DIR, OCR_TEXT_ONLY_MAX_FIGURE_INK, OCR_TEXT_ONLY_MIN_CONFIDENCE
 from app.logger import logger
+from app.metrics import span, inc
+
+_tesseract_available = None
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def _is_tesseract_available():
+    """Check once per process whether the tesseract binary can be used"""
+    global _tesseract_available
+    if _tesseract_available is None:
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+            _tesseract_available = True
+        except Exception as e:
+            logger.warning(f"Tesseract OCR is not available, scanned pages will have no text: {e}")
+            _tesseract_available = False
+    return _tesseract_available
+
+def _ocr_dpi(page):
+    """Pick a render DPI close to the native resolution of the page's largest image"""
+    best_dpi = None
+    best_area = 0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        width_in = (x1 - x0) / 72
+        if width_in <= 0 or info["width"] * info["height"] <= best_area:
+            continue
+        best_area = info["width"] * info["height"]
+        best_dpi = info["width"] / width_in
+    if best_dpi is None:
+        return OCR_DEFAULT_DPI
+    return int(min(OCR_MAX_DPI, max(OCR_MIN_DPI, best_dpi)))
+
+def page_fingerprint(doc, page):
+    """Hash a PDF page's content stream and embedded images, so unchanged pages can be recognized across uploads"""
+    digest = hashlib.sha256()
+    digest.update(page.read_contents())
+    for img in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(img[0]) or b"")
+    return digest.hexdigest()
+
+def _ocr_cache_key(doc, page, dpi):
+    """Identical scans rendered at the same DPI share a cache entry"""
+    return hashlib.sha256(f"{page_fingerprint(doc, page)}:{dpi}:{OCR_LANGUAGE}:{OCR_TEXT_ONLY_MIN_CONFIDENCE}".encode()).hexdigest()
+
+def _read_ocr_cache(key):
+    """Returns the cached (text, figure_ink) of a page, or None"""
+    cache_path = os.path.join(OCR_CACHE_DIR, f"{key}.json")
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            return entry["text"], entry["figure_ink"]
+        except Exception as e:
+            logger.debug(f"Failed to read OCR cache entry {key}: {e}")
+    return None
+
+def _write_ocr_cache(key, result):
+    text, figure_ink = result
+    try:
+        os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+        cache_path = os.path.join(OCR_CACHE_DIR, f"{key}.json")
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"text": text, "figure_ink": figure_ink}, f)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        logger.debug(f"Failed to write OCR cache entry {key}: {e}")
+
+def _text_from_ocr_data(data):
+    """Rebuild page text from tesseract word boxes: words joined per line, a blank line between paragraphs"""
+    lines = []
+    current = None
+    for block, paragraph, line, word in zip(data["block_num"], data["par_num"], data["line_num"], data["text"]):
+        if not str(word).strip():
+            continue
+        key = (block, paragraph, line)
+        if key == current:
+            lines[-1] += f" {word}"
+            continue
+        if current is not None and key[:2] != current[:2]:
+            lines.append("")
+        lines.append(str(word))
+        current = key
+    return "\n".join(lines)
+
+def _figure_ink(image, data):
+    """Share of the page's ink outside confidently recognized words, i.e. charts, diagrams and photos"""
+    import numpy as np
+
+    ink = np.asarray(image) < 128
+    total = int(ink.sum())
+    if not total:
+        return 0.0
+    in_words = np.zeros(ink.shape, dtype=bool)
+    for left, top, width, height, conf, word in zip(data["left"], data["top"], data["width"], data["height"], data["conf"], data["text"]):
+        if str(word).strip() and float(conf) >= OCR_TEXT_ONLY_MIN_CONFIDENCE:
+            # Glyph boxes are tight; pad them so anti-aliased edges count as text
+            pad = max(1, height // 4)
+            in_words[max(top - pad, 0):top + height + pad, max(left - pad, 0):left + width + pad] = True
+    return float(ink[~in_words].sum()) / total
+
+def _ocr_page(file_path, page_index, dpi, language):
+    """Render one PDF page and OCR it with tesseract (runs in a worker process). Returns (text, figure_ink)"""
+    import fitz
+    import pytesseract
+    from PIL import Image
+
+    with fitz.open(file_path) as doc:
+        pix = doc.load_page(page_index).get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    data = pytesseract.image_to_data(image, lang=language, output_type=pytesseract.Output.DICT)
+    return _text_from_ocr_data(data), _figure_ink(image, data)
+
+def _get_ocr_pool():
+    """Return the shared OCR process pool, creating it on first use so workers are spawned once per process."""
+    global _ocr_pool
+    if _ocr_pool is None:
+        with _ocr_pool_lock:
+            if _ocr_pool is None:
+                _ocr_pool = ProcessPoolExecutor(max_workers=max(1, OCR_WORKERS), mp_context=get_context("spawn"))
+    return _ocr_pool
+
+def _reset_ocr_pool(pool):
+    """Discard a pool whose workers died, so the next upload gets a fresh one"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is pool:
+            _ocr_pool = None
+    pool.shutdown(wait=False)
+
+def _ocr_pages(file_path, page_indexes):
+    """OCR the given pages in a process pool, serving repeated pages from the cache. Returns {page_index: (text, figure_ink)}"""
+    import fitz
+
+    results = {}
+    pending = []
+    with fitz.open(file_path) as doc:
+        for page_index in page_indexes:
+            page = doc.load_page(page_index)
+            if not page.get_images():
+                continue  # Blank page, nothing to OCR
+            dpi = _ocr_dpi(page)
+            key = _ocr_cache_key(doc, page, dpi)
+            cached = _read_ocr_cache(key)
+            if cached is not None:
+                inc("docsearch_cache_hits_total", cache="ocr")
+                results[page_index] = cached
+            else:
+                inc("docsearch_cache_misses_total", cache="ocr")
+                pending.append((page_index, dpi, key))
+
+    if pending:
+        logger.info(f"OCR: {len(pending)} page(s) to recognize, {len(results)} served from cache")
+        pool = _get_ocr_pool()
+        with span("ocr"):
+            try:
+                futures = {
+                    pool.submit(_ocr_page, file_path, page_index, dpi, OCR_LANGUAGE): (page_index, key)
+                    for page_index, dpi, key in pending
+                }
+            except BrokenProcessPool:
+                _reset_ocr_pool(pool)
+                raise
+            for future, (page_index, key) in futures.items():
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    _reset_ocr_pool(pool)
+                    logger.error(f"OCR failed for page {page_index+1}: {e}")
+                    continue
+                except Exception as e:
+                    logger.error(f"OCR failed for page {page_index+1}: {e}")
+                    continue
+                results[page_index] = result
+                _write_ocr_cache(key, result)
+    return results
+
+def join_pages(page_texts):
+    """Join page texts with newlines. Returns the text and the offset at which each page starts"""
+    parts = []
+    page_starts = []
+    offset = 0
+    for page_text in page_texts:
+        page_starts.append(offset)
+        parts.append(page_text + "\n")
+        offset += len(page_text) + 1
+    return "".join(parts), page_starts
+
+def extract_pdf_pages(file_path):
+    """Extract text per PDF page, OCRing pages that have no text layer. Returns (page_num, text, source) tuples.
+
+    source is "text" for the PDF text layer, "ocr" for OCRed pages that may contain figures, and
+    "ocr_text_only" for OCRed pages whose ink is (nearly) all recognized words.
+    """
+    import PyPDF2
+
+    pages = []
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page_num in range(len(pdf_reader.pages)):
+            page_text = pdf_reader.pages[page_num].extract_text() or ""
+            pages.append((page_num + 1, page_text, "text"))
+
+    scanned = [page_num - 1 for page_num, page_text, _ in pages if len(page_text.strip()) < OCR_MIN_TEXT_CHARS]
+    if scanned and OCR_ENABLED and _is_tesseract_available():
+        try:
+            ocr_texts = _ocr_pages(file_path, scanned)
+        except Exception as e:
+            logger.error(f"Error running OCR on PDF file: {e}")
+            ocr_texts = {}
+        for page_index, (ocr_text, figure_ink) in ocr_texts.items():
+            if len(ocr_text.strip()) > len(pages[page_index][1].strip()):
+                source = "ocr_text_only" if figure_ink <= OCR_TEXT_ONLY_MAX_FIGURE_INK else "ocr"
+                pages[page_index] = (page_index + 1, ocr_text, source)
+        recovered = sum(1 for p in pages if p[2] != "text")
+        text_only = sum(1 for p in pages if p[2] == "ocr_text_only")
+        logger.info(f"OCR recovered text for {recovered} of {len(scanned)} page(s) without a text layer ({text_only} text-only)")
+    return pages
 
 def extract_text_from_file(file_path):
     """Extract text content from a file based on its extension"""
@@ -20,11 +246,8 @@ def extract_text_from_file(file_path):
                 
         elif file_extension == 'pdf':
             try:
-                text = ""
-                with open(file_path, 'rb') as file: 
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    for page_num in range(len(pdf_reader.pages)):
-                        text += pdf_reader.pages[page_num].extract_text() + "\n"
+                pages = extract_pdf_pages(file_path)
+                text, _ = join_pages(page_text for _, page_text, _ in pages)
                 return text
             except Exception as e:
                 logger.error(f"Error reading PDF file: {e}")
@@ -44,6 +267,7 @@ def extract_text_from_file(file_path):
             
         elif file_extension == 'xlsx':
             try:
+                from openpyxl import load_workbook
                 text = ""
                 workbook = load_workbook(file_path, read_only=True)
                 for sheet in workbook:
@@ -59,27 +283,202 @@ def extract_text_from_file(file_path):
         logger.error(f"Error extracting text from file: {e}")
         return ""
 
-def create_chunks(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    """Split text into chunks with overlap using LangChain's RecursiveCharacterTextSplitter"""
+CHUNK_SEPARATORS = ["\n\n", "\n", " ", ""]
+
+def _split_spans(text, start, end, separator):
+    """Split text[start:end] on a literal separator, keeping it at the start of each piece, as (start, end) spans"""
+    if separator == "":
+        return [(i, i + 1) for i in range(start, end)]
+    spans = []
+    piece_start = start
+    pos = text.find(separator, start, end)
+    while pos != -1:
+        if pos > piece_start:
+            spans.append((piece_start, pos))
+        piece_start = pos
+        pos = text.find(separator, pos + len(separator), end)
+    if end > piece_start:
+        spans.append((piece_start, end))
+    return spans
+
+def _strip_span(text, start, end):
+    """Shrink a span to exclude surrounding whitespace, or return None if nothing is left"""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if start < end else None
+
+def _merge_spans(text, spans, chunk_size, overlap, out):
+    """Merge consecutive small spans into chunks of at most chunk_size with up to overlap characters shared"""
+    current = deque()
+    total = 0
+    for start, end in spans:
+        length = end - start
+        if total + length > chunk_size and current:
+            merged = _strip_span(text, current[0][0], current[-1][1])
+            if merged:
+                out.append(merged)
+            while total > overlap or (total + length > chunk_size and total > 0):
+                first_start, first_end = current.popleft()
+                total -= first_end - first_start
+        current.append((start, end))
+        total += length
+    if current:
+        merged = _strip_span(text, current[0][0], current[-1][1])
+        if merged:
+            out.append(merged)
+
+def _recursive_spans(text, start, end, separators, chunk_size, overlap, out):
+    """Offset-based equivalent of RecursiveCharacterTextSplitter._split_text"""
+    separator = separators[-1]
+    next_separators = []
+    for i, candidate in enumerate(separators):
+        if candidate == "":
+            separator = candidate
+            break
+        if text.find(candidate, start, end) != -1:
+            separator = candidate
+            next_separators = separators[i + 1:]
+            break
+
+    good_spans = []
+    for span_start, span_end in _split_spans(text, start, end, separator):
+        if span_end - span_start < chunk_size:
+            good_spans.append((span_start, span_end))
+            continue
+        if good_spans:
+            _merge_spans(text, good_spans, chunk_size, overlap, out)
+            good_spans = []
+        if not next_separators:
+            out.append((span_start, span_end))
+        else:
+            _recursive_spans(text, span_start, span_end, next_separators, chunk_size, overlap, out)
+    if good_spans:
+        _merge_spans(text, good_spans, chunk_size, overlap, out)
+
+def create_chunk_spans(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, page_starts=None):
+    """Split text into (start, end, page) spans with the same boundaries as LangChain's RecursiveCharacterTextSplitter.
+
+    page_starts holds the offset at which each page begins; page is 1-based, or None without page information.
+    """
     if not text:
         return []
-    
-    try:    
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=overlap,
-            length_function=len,
-        )
-        chunks = text_splitter.split_text(text)
-        return chunks
+
+    spans = []
+    try:
+        _recursive_spans(text, 0, len(text), CHUNK_SEPARATORS, chunk_size, overlap, spans)
     except Exception as e:
-        logger.error(f"Error in create_chunks: {e}")
+        logger.error(f"Error in create_chunk_spans: {e}")
         # Fallback to a simple chunking method
-        chunks = []
+        spans = []
         start = 0
         text_length = len(text)
         while start < text_length:
             end = min(start + chunk_size, text_length)
-            chunks.append(text[start:end])
+            spans.append((start, end))
             start = end - overlap if end < text_length else text_length
-        return chunks
+
+    if not page_starts:
+        return [(start, end, None) for start, end in spans]
+    return [(start, end, max(1, bisect_right(page_starts, start))) for start, end in spans]
+
+def create_chunks(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Split text into chunks with overlap, matching LangChain's RecursiveCharacterTextSplitter"""
+    return [text[start:end] for start, end, _ in create_chunk_spans(text, chunk_size, overlap)]
+
+def _format_row(row):
+    """Render a table row as text, dropping trailing empty cells"""
+    cells = ["" if cell is None else str(cell) for cell in row]
+    while cells and cells[-1].strip() == "":
+        cells.pop()
+    return ", ".join(cells)
+
+def iter_table_rows(file_path):
+    """Stream (sheet_name, row_number, row_text) from a CSV or XLSX file without loading it in memory"""
+    file_extension = file_path.rsplit('.', 1)[1].lower()
+    if file_extension == 'csv':
+        with open(file_path, 'r', encoding='utf-8', errors='replace', newline='') as file:
+            for row_number, row in enumerate(csv.reader(file), start=1):
+                yield None, row_number, _format_row(row)
+    elif file_extension == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook:
+                for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                    yield sheet.title, row_number, _format_row(row)
+        finally:
+            workbook.close()
+
+def create_table_chunks(file_path, chunk_size=CHUNK_SIZE, rows=None):
+    """Group CSV/XLSX rows into row-aligned chunks that each repeat the header row.
+
+    Yields dicts with the chunk text, the sheet name (None for CSV) and the 1-based row range it covers.
+    A file that cannot be read to the end raises after the chunks read so far.
+    `rows` replaces iter_table_rows(file_path) as the row source, e.g. to time the reads.
+    """
+    state = {"sheet": object(), "header": None, "header_row": None, "rows": [], "row_start": None, "row_end": None, "emitted": False}
+
+    def flush():
+        # A sheet holding only a header row is still worth one chunk
+        if not state["rows"] and (state["emitted"] or state["header"] is None):
+            return None
+        rows = state["rows"]
+        row_start = state["row_start"] if rows else state["header_row"]
+        row_end = state["row_end"] if rows else state["header_row"]
+        chunk = {
+            "text": "\n".join([state["header"]] + rows),
+            "sheet": state["sheet"],
+            "row_start": row_start,
+            "row_end": row_end,
+        }
+        state["rows"] = []
+        state["emitted"] = True
+        return chunk
+
+    try:
+        row_budget = chunk_size
+        rows_size = 0
+        for sheet_name, row_number, row_text in (iter_table_rows(file_path) if rows is None else rows):
+            if sheet_name != state["sheet"]:
+                chunk = flush()
+                if chunk:
+                    yield chunk
+                state.update(sheet=sheet_name, header=None, header_row=None, rows=[], emitted=False)
+            if not row_text.strip():
+                continue
+            if state["header"] is None:
+                # The first non-empty row of each sheet is its header. Very wide headers may take
+                # at most half of the budget so that rows are not shredded into tiny pieces.
+                state.update(header=row_text, header_row=row_number)
+                row_budget = max(chunk_size - len(row_text) - 1, chunk_size // 2, 1)
+                rows_size = 0
+                continue
+
+            if state["rows"] and rows_size + 1 + len(row_text) > row_budget:
+                yield flush()
+                rows_size = 0
+
+            if len(row_text) > row_budget:
+                # A single row larger than the budget is split on its own, keeping the header on each piece
+                for piece in create_chunks(row_text, chunk_size=row_budget, overlap=0):
+                    state.update(rows=[piece], row_start=row_number, row_end=row_number)
+                    yield flush()
+                continue
+
+            if not state["rows"]:
+                state["row_start"] = row_number
+                rows_size = len(row_text)
+            else:
+                rows_size += 1 + len(row_text)
+            state["rows"].append(row_text)
+            state["row_end"] = row_number
+
+        chunk = flush()
+        if chunk:
+            yield chunk
+    except Exception as e:
+        # Re-raised so callers never mistake a partial read for the whole table
+        logger.error(f"Error in create_table_chunks: {e}")
+        raise
@@ -1,27 +1,70 @@
 import os
 import io
-import fitz
 import base64
-import uuid
 import time
 import tempfile
-from PIL import Image
-from litellm import completion
-from qdrant_client.http.models import PointStruct
-from app.config import GEMINI_API_KEY, LLM_IMAGE_PROMPT, QDRANT_COLLECTION, IMAGE_MODEL
+from app.config import GEMINI_API_KEY, LLM_IMAGE_PROMPT, QDRANT_COLLECTION, IMAGE_MODEL, IMAGE_REQUEST_DELAY_SECONDS, EMBEDDING_DIM
 from app.logger import logger
-from app.services.llm_service import generate_embedding
-from app.services.vector_service import qdrant_client
+from app.metrics import span, provider_call, record_usage, inc
+from app.services.llm_service import generate_embedding, is_fallback_embedding
+from app.services.quota_service import provider_slot
+from app.services.vector_service import get_qdrant_client, stable_point_id
+from app.services.extraction_service import page_fingerprint
+
+def _store_page_point(point, page_num, stored_message):
+    try:
+        with span("upsert"):
+            get_qdrant_client().upsert(collection_name=QDRANT_COLLECTION, points=[point])
+        inc("docsearch_points_upserted_total", 1)
+        logger.info(f"Page {page_num+1}: {stored_message}")
+    except Exception as upsert_ex:
+        logger.error(f"Page {page_num+1}: Failed to store image point: {str(upsert_ex)}")
+
+def _skipped_page_point(filename, session_id, page_num, page_hash):
+    """Payload-only record of a page the vision model found irrelevant, so re-uploads do not send it again.
+
+    It shares the ID a description of the page would get and is excluded from search.
+    """
+    from qdrant_client.http.models import PointStruct
+    return PointStruct(
+        id=stable_point_id(session_id, filename, "image", page_hash),
+        vector=[0.0] * EMBEDDING_DIM,
+        payload={
+            "source_type": "image_skipped",
+            "session_id": session_id,
+            "page": page_num+1,
+            "source_filename": filename,
+            "content_hash": page_hash
+        }
+    )
+
+def process_pdf_images_and_store(filename, tmp_path, session_id, skip_pages=None, known_hashes=None):
+    """Process images in a PDF, generate descriptions, and store in Qdrant.
+
+    Pages in skip_pages (1-based) were already read by OCR as text-only scans and are not sent to the vision model.
+    Pages whose fingerprint is in known_hashes are already described (or recorded as irrelevant) in Qdrant and are skipped as well.
+    Pages whose vision call failed store nothing, so the next upload tries them again.
+    Returns the fingerprints of all pages with significant images.
+    """
+    import fitz
+    from PIL import Image
+    from litellm import completion
+    from qdrant_client.http.models import PointStruct
 
-def process_pdf_images_and_store(uploaded_file, tmp_path, session_id):
-    """Process images in a PDF, generate descriptions, and store in Qdrant"""
     doc = fitz.open(tmp_path)
-    logger.info(f"Processing PDF '{uploaded_file.name}' with {len(doc)} pages (Session: {session_id})")
+    logger.info(f"Processing PDF '{filename}' with {len(doc)} pages (Session: {session_id})")
     
     total_images_found = 0
     pages_with_large_images = 0
 
+    skip_pages = skip_pages or set()
+    known_hashes = known_hashes or set()
+    page_hashes = set()
+
     for page_num in range(len(doc)):
+        if page_num + 1 in skip_pages:
+            logger.debug(f"Page {page_num+1}: Skipped (text-only scan handled by OCR)")
+            continue
         page = doc.load_page(page_num)
         image_list = page.get_images(full=True)
         total_images_found += len(image_list)
@@ -39,74 +82,80 @@ def process_pdf_images_and_store(uploaded_file, tmp_path, session_id):
         
         if has_large_image:
             pages_with_large_images += 1
+            page_hash = page_fingerprint(doc, page)
+            page_hashes.add(page_hash)
+            if page_hash in known_hashes:
+                logger.debug(f"Page {page_num+1}: Skipped (unchanged since last upload)")
+                continue
             logger.info(f"Page {page_num+1}: Large image(s) detected. Generating description...")
             
             # Render the whole page as an image
-            page_pix = page.get_pixmap(dpi=450)
-            img_pil = Image.open(io.BytesIO(page_pix.tobytes("png")))
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as img_temp:
-                img_pil.save(img_temp.name, "PNG", optimize=True)
-                img_temp_path = img_temp.name
+            with span("render"):
+                page_pix = page.get_pixmap(dpi=450)
+                img_pil = Image.open(io.BytesIO(page_pix.tobytes("png")))
                 
-            with open(img_temp_path, "rb") as img_file:
-                img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as img_temp:
+                    img_pil.save(img_temp.name, "PNG", optimize=True)
+                    img_temp_path = img_temp.name
+                    
+                with open(img_temp_path, "rb") as img_file:
+                    img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
             
             max_retries = 3
             retry_count = 0
             description = None
-            while retry_count < max_retries and description is None:
-                try:
-                    time.sleep(4)  # Small delay to avoid rate limiting
-                    llm_response = completion(
-                        model=IMAGE_MODEL,
-                        api_key=GEMINI_API_KEY,
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": LLM_IMAGE_PROMPT},
-                                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_base64}"}}
+            with span("vision"):
+                while retry_count < max_retries and description is None:
+                    try:
+                        time.sleep(IMAGE_REQUEST_DELAY_SECONDS)  # Small delay to avoid rate limiting
+                        with provider_slot("vision"), provider_call("vision", IMAGE_MODEL):
+                            llm_response = completion(
+                                model=IMAGE_MODEL,
+                                api_key=GEMINI_API_KEY,
+                                messages=[
+                                    {
+                                        "role": "user",
+                                        "content": [
+                                            {"type": "text", "text": LLM_IMAGE_PROMPT},
+                                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_base64}"}}
+                                        ]
+                                    }
                                 ]
-                            }
-                        ]
-                    )
-                    description = llm_response['choices'][0]['message']['content']
-                    usage = llm_response.get("usage", {})
-                    logger.info(f"[IMAGE LLM] Page {page_num+1}: Input tokens: {usage.get('prompt_tokens', 'N/A')}, Output tokens: {usage.get('completion_tokens', 'N/A')}")
-                except Exception as e:
-                    retry_count += 1
-                    logger.warning(f"Page {page_num+1}: LLM description attempt {retry_count} failed: {str(e)}")
-                    time.sleep(2 ** retry_count)
+                            )
+                        description = llm_response['choices'][0]['message']['content']
+                        usage = llm_response.get("usage", {})
+                        record_usage("vision", usage)
+                        logger.info(f"[IMAGE LLM] Page {page_num+1}: Input tokens: {usage.get('prompt_tokens', 'N/A')}, Output tokens: {usage.get('completion_tokens', 'N/A')}")
+                    except Exception as e:
+                        retry_count += 1
+                        inc("docsearch_retries_total", call="vision")
+                        logger.warning(f"Page {page_num+1}: LLM description attempt {retry_count} failed: {str(e)}")
+                        time.sleep(2 ** retry_count)
             
-            if description and description.strip().lower() != "none":
-                image_dimensions = f"{img_pil.width}x{img_pil.height}"
-                chunk = description.strip()
-                
-                if len(chunk) >= 20:
-                    chunk_embedding = generate_embedding(chunk)
-                    unique_id = str(uuid.uuid4())
-                    
-                    point = PointStruct(
-                        id=unique_id,
-                        vector=chunk_embedding,
-                        payload={
-                            "filename": f"{uploaded_file.name}_page_{page_num+1}_fullpage",
-                            "document": chunk,
-                            "source_type": "image_description",
-                            "session_id": session_id,
-                            "page": page_num+1,
-                            "dimensions": image_dimensions
-                        }
-                    )
-                    
-                    try:
-                        qdrant_client.upsert(collection_name=QDRANT_COLLECTION, points=[point])
-                        logger.info(f"Page {page_num+1}: Successfully stored image description in Qdrant")
-                    except Exception as upsert_ex:
-                        logger.error(f"Page {page_num+1}: Failed to store image embedding: {str(upsert_ex)}")
-            elif description and description.strip().lower() == "none":
-                logger.info(f"Page {page_num+1}: AI determined image is not relevant (returned 'none')")
+            chunk = description.strip() if description else ""
+            if description is None:
+                logger.warning(f"Page {page_num+1}: No description after {max_retries} attempts; it will be retried on the next upload")
+            elif chunk.lower() == "none" or len(chunk) < 20:
+                verdict = "returned 'none'" if chunk.lower() == "none" else f"description too short ({len(chunk)} chars)"
+                logger.info(f"Page {page_num+1}: AI determined image is not relevant ({verdict})")
+                _store_page_point(_skipped_page_point(filename, session_id, page_num, page_hash), page_num, "Recorded page as not relevant")
+            else:
+                chunk_embedding = generate_embedding(chunk)
+                payload = {
+                    "filename": f"{filename}_page_{page_num+1}_fullpage",
+                    "document": chunk,
+                    "source_type": "image_description",
+                    "session_id": session_id,
+                    "page": page_num+1,
+                    "dimensions": f"{img_pil.width}x{img_pil.height}",
+                    "source_filename": filename,
+                    "content_hash": page_hash
+                }
+                if is_fallback_embedding(chunk_embedding):
+                    # Flagged so the next upload describes this page again
+                    payload["embedding_failed"] = True
+                point = PointStruct(id=stable_point_id(session_id, filename, "image", page_hash), vector=chunk_embedding, payload=payload)
+                _store_page_point(point, page_num, "Successfully stored image description in Qdrant")
             
             if os.path.exists(img_temp_path):
                 os.remove(img_temp_path)
@@ -114,8 +163,9 @@ def process_pdf_images_and_store(uploaded_file, tmp_path, session_id):
             logger.debug(f"Page {page_num+1}: Skipped ({reason})")
                 
     if total_images_found == 0:
-        logger.info(f"No images found in PDF '{uploaded_file.name}'")
+        logger.info(f"No images found in PDF '{filename}'")
     else:
-        logger.info(f"Image processing complete for '{uploaded_file.name}'. Found {total_images_found} images total across {len(doc)} pages. Processed {pages_with_large_images} pages with significant images.")
+        logger.info(f"Image processing complete for '{filename}'. Found {total_images_found} images total across {len(doc)} pages. Processed {pages_with_large_images} pages with significant images.")
     
     doc.close()
+    return page_hashes
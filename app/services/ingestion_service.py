@@ -0,0 +1,204 @@
+import os
+import time
+import hashlib
+import tempfile
+from app.config import UPSERT_BATCH_SIZE
+from app.logger import logger
+from app.metrics import span, record_stage
+from app.services.extraction_service import extract_text_from_file, extract_pdf_pages, join_pages, create_chunk_spans, create_table_chunks, iter_table_rows
+from app.services.llm_service import generate_embedding, is_fallback_embedding
+from app.services.vector_service import upsert_points, stable_point_id, get_points_by_payload, delete_points, set_payloads
+from app.services.image_service import process_pdf_images_and_store
+from app.services.quota_service import quota_context, BULK
+
+TABLE_EXTENSIONS = {'csv', 'xlsx'}
+
+# Payload fields describing where a chunk sits in its file; refreshed when an unchanged chunk moves
+PROVENANCE_KEYS = ["char_start", "char_end", "page", "sheet", "row_start", "row_end"]
+
+def store_chunks(chunks, filename, session_id, existing=None, batch_size=UPSERT_BATCH_SIZE):
+    """Embed and upsert (text, extra_payload) pairs in bounded batches.
+
+    Point IDs are derived from each chunk's content hash, so chunks already stored in `existing`
+    ({point_id: payload}) are not embedded again; only their provenance fields are refreshed if they moved.
+    Chunks whose stored embedding had failed are embedded again.
+    Returns the IDs of all chunks of the file and the number of chunks that were embedded.
+    """
+    from qdrant_client.http.models import PointStruct
+
+    existing = existing or {}
+    points = []
+    payload_updates = []
+    point_ids = set()
+    occurrences = {}
+    embedded = 0
+    for chunk, extra_payload in chunks:
+        content_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        occurrence = occurrences.get(content_hash, 0)
+        occurrences[content_hash] = occurrence + 1
+        u_id = stable_point_id(session_id, filename, content_hash, occurrence)
+        point_ids.add(u_id)
+
+        stored_payload = existing.get(u_id)
+        if stored_payload is not None and not stored_payload.get("embedding_failed"):
+            if any(stored_payload.get(key) != value for key, value in extra_payload.items()):
+                payload_updates.append((u_id, extra_payload))
+                if len(payload_updates) >= batch_size:
+                    set_payloads(payload_updates)
+                    payload_updates = []
+            continue
+
+        chunk_embedding = generate_embedding(chunk)
+        payload = {
+            "filename": filename,
+            "document": chunk,
+            "source_type": "document",
+            "session_id": session_id,
+            "content_hash": content_hash,
+            **extra_payload
+        }
+        if is_fallback_embedding(chunk_embedding):
+            # Flagged so the next upload embeds this chunk again instead of keeping the zero vector
+            payload["embedding_failed"] = True
+        points.append(PointStruct(id=u_id, vector=chunk_embedding, payload=payload))
+        if len(points) >= batch_size:
+            upsert_points(points)
+            embedded += len(points)
+            points = []
+    if points:
+        upsert_points(points)
+        embedded += len(points)
+    if payload_updates:
+        set_payloads(payload_updates)
+    return point_ids, embedded
+
+def _timed(iterable, timings, stage):
+    """Yield from iterable, adding the time spent producing each item to timings[stage]"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timings[stage] += time.perf_counter() - start
+        yield item
+
+def _table_chunks(file_path, file_ext):
+    """Adapt create_table_chunks output to (text, extra_payload) pairs.
+
+    Rows are read and grouped lazily between embedding batches, so the extract and chunk stages
+    are timed per item and recorded once the file is done.
+    """
+    timings = {"extract": 0.0, "chunk": 0.0}
+    rows = _timed(iter_table_rows(file_path), timings, "extract")
+    try:
+        for chunk in _timed(create_table_chunks(file_path, rows=rows), timings, "chunk"):
+            extra_payload = {"row_start": chunk["row_start"], "row_end": chunk["row_end"]}
+            if chunk["sheet"] is not None:
+                extra_payload["sheet"] = chunk["sheet"]
+            yield chunk["text"], extra_payload
+    finally:
+        # Chunk timing includes the row reads it triggered
+        record_stage("extract", timings["extract"], file_type=file_ext)
+        record_stage("chunk", max(timings["chunk"] - timings["extract"], 0.0), file_type=file_ext)
+
+def _text_chunks(text, page_starts=None):
+    """Yield (text, extra_payload) pairs from chunk spans, slicing each chunk only when it is embedded"""
+    with span("chunk"):
+        spans = create_chunk_spans(text, page_starts=page_starts)
+    for start, end, page in spans:
+        extra_payload = {"char_start": start, "char_end": end}
+        if page is not None:
+            extra_payload["page"] = page
+        yield text[start:end], extra_payload
+
+def ingest_file(file_path, filename, session_id, process_images=True):
+    """Extract, chunk, embed and store a single file for a session. Returns the number of text chunks in the file.
+
+    If the file was stored before, only new or changed chunks are embedded and chunks that vanished are deleted.
+    """
+    logger.info(f"Processing file: {filename}")
+    file_ext = filename.rsplit('.', 1)[-1].lower()
+
+    # Ingestion yields provider quota to interactive queries from any session
+    with span("ingest", file_type=file_ext), quota_context(session_id, BULK):
+        existing = get_points_by_payload(
+            session_id,
+            payload_keys=["content_hash", "embedding_failed"] + PROVENANCE_KEYS,
+            filename=filename,
+            source_type="document"
+        )
+        try:
+            point_ids, embedded = _ingest_file(file_path, file_ext, filename, session_id, process_images, existing)
+        except Exception:
+            # Chunks after the failure point were never seen, so none of the stored ones count as vanished
+            if existing:
+                logger.warning(f"Ingesting '{filename}' did not finish; keeping its {len(existing)} stored chunks")
+            raise
+
+        vanished = [point_id for point_id in existing if point_id not in point_ids]
+        if vanished and not point_ids:
+            # Most likely an extraction failure rather than an emptied document
+            logger.warning(f"'{filename}' produced no text; keeping its {len(existing)} stored chunks")
+        elif vanished:
+            delete_points(vanished)
+
+    if existing:
+        logger.info(f"Re-ingested '{filename}': {len(point_ids) - embedded} unchanged, {embedded} new or changed, {len(vanished)} removed chunks")
+    return len(point_ids)
+
+def _ingest_file(file_path, file_ext, filename, session_id, process_images, existing):
+    # Spreadsheets are streamed row by row into header-aware chunks
+    if file_ext in TABLE_EXTENSIONS:
+        return store_chunks(_table_chunks(file_path, file_ext), filename, session_id, existing)
+
+    # 1. Extract text (scanned PDF pages are OCRed locally)
+    ocr_pages = set()
+    page_starts = None
+    with span("extract", file_type=file_ext):
+        if file_ext == "pdf":
+            try:
+                pages = extract_pdf_pages(file_path)
+            except Exception as e:
+                logger.error(f"Error reading PDF file: {e}")
+                pages = []
+            text, page_starts = join_pages(page_text for _, page_text, _ in pages)
+            # Only scans without figures skip the vision model; their text is fully covered by OCR
+            ocr_pages = {page_num for page_num, _, source in pages if source == "ocr_text_only"}
+        else:
+            text = extract_text_from_file(file_path)
+
+    # 2. Vectorize and store text
+    point_ids, embedded = set(), 0
+    if text:
+        point_ids, embedded = store_chunks(_text_chunks(text, page_starts), filename, session_id, existing)
+
+    # 3. Process images if PDF, describing only pages that changed since the last upload
+    if process_images and file_ext == "pdf":
+        try:
+            # Descriptions and pages recorded as irrelevant ("image_skipped") both carry source_filename
+            stored_images = get_points_by_payload(session_id, payload_keys=["content_hash", "embedding_failed"], source_filename=filename)
+            known_hashes = {payload.get("content_hash"): point_id for point_id, payload in stored_images.items()}
+            # Pages whose description could not be embedded are described again
+            described = {payload.get("content_hash") for payload in stored_images.values() if not payload.get("embedding_failed")}
+            page_hashes = process_pdf_images_and_store(filename, file_path, session_id, skip_pages=ocr_pages, known_hashes=described)
+            delete_points([point_id for page_hash, point_id in known_hashes.items() if page_hash not in page_hashes])
+        except Exception as e:
+            logger.error(f"Failed to process images: {str(e)}")
+
+    return point_ids, embedded
+
+def ingest_upload(data, filename, session_id, process_images=True):
+    """Write uploaded bytes to a temporary file, ingest it and clean up afterwards."""
+    file_ext = filename.rsplit('.', 1)[-1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_ext}") as tmp_file:
+        tmp_file.write(data)
+        tmp_path = tmp_file.name
+
+    try:
+        return ingest_file(tmp_path, filename, session_id, process_images=process_images)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
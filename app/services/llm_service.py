@@ -1,43 +1,91 @@
-from litellm import embedding, completion
 from app.config import EMBEDDING_MODEL, GEMINI_API_KEY, EMBEDDING_DIM, RAG_MODEL, RAG_SYSTEM_PROMPT
 from app.logger import logger
+from app.metrics import span, provider_call, record_usage, inc
+from app.services.quota_service import provider_slot
 
 def generate_embedding(text):
     """Generate embedding vector for given text"""
+    from litellm import embedding
     try:
-        response = embedding(
-            input=[text],
-            model=EMBEDDING_MODEL,
-            api_key=GEMINI_API_KEY,
-        )
+        with span("embed"), provider_slot("embedding"), provider_call("embedding", EMBEDDING_MODEL):
+            response = embedding(
+                input=[text],
+                model=EMBEDDING_MODEL,
+                api_key=GEMINI_API_KEY,
+            )
+        record_usage("embedding", response.get("usage"))
         return response['data'][0]['embedding']
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
+        inc("docsearch_zero_vector_fallbacks_total")
         return [0.0] * EMBEDDING_DIM
 
-def get_rag_answer(query, context_text):
+def is_fallback_embedding(vector):
+    """True for the zero vector generate_embedding returns when the provider call failed"""
+    return not any(vector)
+
+def build_rag_prompt(query, context_text):
+    """Build the RAG prompt from the system prompt, context and user query"""
+    return (
+        f"{RAG_SYSTEM_PROMPT}\n\n"
+        + f"Context:\n{context_text}\n\nUser Query: {query}\n\nAnswer:"
+    )
+
+def get_rag_answer(query, context_text, session_id=None):
     """Generate RAG answer using LLM"""
+    from litellm import completion
     if not context_text.strip():
         return "Not found in the provided documents"
         
-    prompt = (
-        f"{RAG_SYSTEM_PROMPT}\n\n"
-        + f"Context:\n{context_text}\n\nUser Query: {query}\n\nAnswer:"
-    )
+    prompt = build_rag_prompt(query, context_text)
     
     try:
-        llm_response = completion(
-            model=RAG_MODEL,
-            api_key=GEMINI_API_KEY,
-            temperature=0.1,
-            messages=[
-                {"role": "user", "content": [{"type": "text", "text": prompt}]}
-            ]
-        )
+        with span("rag"), provider_slot("rag", session_id), provider_call("rag", RAG_MODEL):
+            llm_response = completion(
+                model=RAG_MODEL,
+                api_key=GEMINI_API_KEY,
+                temperature=0.1,
+                messages=[
+                    {"role": "user", "content": [{"type": "text", "text": prompt}]}
+                ]
+            )
         answer = llm_response['choices'][0]['message']['content']
         usage = llm_response.get("usage", {})
+        record_usage("rag", usage)
         logger.info(f"[RAG LLM] Input tokens: {usage.get('prompt_tokens', 'N/A')}, Output tokens: {usage.get('completion_tokens', 'N/A')}")
         return answer
     except Exception as e:
         logger.error(f"LLM RAG answer failed: {str(e)}")
         return f"Error generating answer: {str(e)}"
+
+def stream_rag_answer(query, context_text, session_id=None):
+    """Generate RAG answer using LLM, yielding text fragments as they arrive"""
+    from litellm import completion
+    if not context_text.strip():
+        yield "Not found in the provided documents"
+        return
+
+    prompt = build_rag_prompt(query, context_text)
+
+    try:
+        with span("rag", stream="true"):
+            # The quota slot covers starting the stream only; holding it while a slow client
+            # reads the answer would block provider calls for every session
+            with provider_slot("rag_stream", session_id), provider_call("rag_stream", RAG_MODEL):
+                llm_stream = completion(
+                    model=RAG_MODEL,
+                    api_key=GEMINI_API_KEY,
+                    temperature=0.1,
+                    stream=True,
+                    messages=[
+                        {"role": "user", "content": [{"type": "text", "text": prompt}]}
+                    ]
+                )
+            for part in llm_stream:
+                delta = getattr(part.choices[0].delta, 'content', None)
+                if delta:
+                    yield delta
+        logger.info("[RAG LLM] Streamed answer complete")
+    except Exception as e:
+        logger.error(f"LLM RAG answer stream failed: {str(e)}")
+        yield f"Error generating answer: {str(e)}"
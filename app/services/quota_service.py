@@ -0,0 +1,259 @@
+import time
+import sqlite3
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from app.config import QUOTA_SCHEDULER_ENABLED, QUOTA_MAX_CONCURRENCY, QUOTA_INTERACTIVE_RESERVE, QUOTA_REQUESTS_PER_MINUTE, QUOTA_BURST, QUOTA_STATE_FILE
+from app.logger import logger
+from app.metrics import observe, set_gauge
+
+# Priority classes, highest first. Queries and RAG answers are interactive; ingestion is bulk.
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+# (session_id, priority) of the provider calls made by the current thread/task
+_quota_context = contextvars.ContextVar("quota_context", default=(None, INTERACTIVE))
+
+# How long a process waits for another process's lock on the shared bucket before retrying
+_SHARED_LOCK_TIMEOUT_SECONDS = 0.25
+_SHARED_LOCK_RETRY_SECONDS = 0.05
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+@contextmanager
+def quota_context(session_id, priority=INTERACTIVE):
+    """Attribute the provider calls made inside the block to a session and priority class"""
+    token = _quota_context.set((session_id, priority))
+    try:
+        yield
+    finally:
+        _quota_context.reset(token)
+
+def _refill_and_take(tokens, elapsed, rate, burst, reserve):
+    """Token bucket step. Returns (tokens left, seconds to wait); a wait of 0 means a token was taken."""
+    tokens = min(burst, tokens + elapsed * rate)
+    needed = 1 + reserve
+    if tokens >= needed:
+        return tokens - 1, 0
+    return tokens, (needed - tokens) / rate
+
+class _LocalBucket:
+    """Requests-per-minute token bucket for this process"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, reserve):
+        now = time.monotonic()
+        self.tokens, wait = _refill_and_take(self.tokens, now - self.updated, self.rate, self.burst, reserve)
+        self.updated = now
+        return wait
+
+class _SharedBucket:
+    """Requests-per-minute token bucket kept in a SQLite file, so every process on the host draws from one quota"""
+
+    def __init__(self, path, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.conn = sqlite3.connect(path, timeout=_SHARED_LOCK_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS quota_bucket (id INTEGER PRIMARY KEY CHECK (id = 1), tokens REAL NOT NULL, updated REAL NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO quota_bucket (id, tokens, updated) VALUES (1, ?, ?)", (burst, time.time()))
+
+    def take(self, reserve):
+        # BEGIN IMMEDIATE takes the write lock up front, so the read-modify-write is atomic across processes
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            logger.debug(f"Quota bucket is locked by another process, retrying: {e}")
+            return _SHARED_LOCK_RETRY_SECONDS
+        try:
+            tokens, updated = self.conn.execute("SELECT tokens, updated FROM quota_bucket WHERE id = 1").fetchone()
+            now = time.time()
+            tokens, wait = _refill_and_take(tokens, max(now - updated, 0), self.rate, self.burst, reserve)
+            self.conn.execute("UPDATE quota_bucket SET tokens = ?, updated = ? WHERE id = 1", (tokens, now))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return wait
+
+class QuotaScheduler:
+    """Admits provider calls by priority class, round-robin across sessions within a class.
+
+    At most max_concurrency calls run at once; bulk calls leave interactive_reserve of those slots
+    (and of the rate-limit tokens) free, so a query never waits behind a long ingest.
+    """
+
+    def __init__(self, max_concurrency, interactive_reserve=0, requests_per_minute=0, burst=0, state_file=None):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.interactive_reserve = min(max(interactive_reserve, 0), self.max_concurrency - 1)
+        self.requests_per_minute = requests_per_minute
+        self.bucket = None
+        if requests_per_minute:
+            rate = requests_per_minute / 60.0
+            burst = max(burst or requests_per_minute // 10, self.interactive_reserve + 1, 1)
+            self.bucket = _SharedBucket(state_file, rate, burst) if state_file else _LocalBucket(rate, burst)
+        self.shared = bool(requests_per_minute and state_file)
+
+        self._cond = threading.Condition()
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._active = 0
+        self._taking_token = False
+        self._stats = {priority: {"dispatched": 0, "wait_total": 0.0, "wait_max": 0.0} for priority in PRIORITIES}
+
+    def _queued(self, priority):
+        return sum(len(tickets) for tickets in self._queues[priority].values())
+
+    def _is_next(self, ticket, priority):
+        """True when the ticket heads the highest non-empty class and a slot is free. Must be called with the condition held."""
+        if self._taking_token:
+            return False
+        head_priority = next((p for p in PRIORITIES if self._queues[p]), None)
+        if head_priority != priority:
+            return False
+        sessions = self._queues[priority]
+        if sessions[next(iter(sessions))][0] is not ticket:
+            return False
+        limit = self.max_concurrency if priority == INTERACTIVE else self.max_concurrency - self.interactive_reserve
+        return self._active < limit
+
+    def _take_token(self, priority):
+        """Take a rate-limit token with the condition released, so bucket I/O never blocks other callers.
+
+        Nothing is dispatched while a token is being taken, so the ticket is still next when this returns.
+        """
+        self._taking_token = True
+        self._cond.release()
+        try:
+            return self.bucket.take(self.interactive_reserve if priority == BULK else 0)
+        finally:
+            self._cond.acquire()
+            self._taking_token = False
+            self._cond.notify_all()
+
+    def _dispatch(self, session_id, priority):
+        # Re-inserting the session moves it to the back of its class: round-robin between sessions
+        sessions = self._queues[priority]
+        tickets = sessions.pop(session_id)
+        tickets.popleft()
+        if tickets:
+            sessions[session_id] = tickets
+        self._active += 1
+
+    def _remove(self, ticket, session_id, priority):
+        tickets = self._queues[priority].get(session_id)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[priority][session_id]
+
+    def acquire(self, call, session_id=None, priority=INTERACTIVE):
+        """Block until the call may run. Every acquire must be paired with release()."""
+        ticket = object()
+        enqueued_at = time.monotonic()
+        with self._cond:
+            self._queues[priority].setdefault(session_id, deque()).append(ticket)
+            set_gauge("docsearch_quota_queue_depth", self._queued(priority), priority=priority)
+            self._cond.notify_all()
+            try:
+                while True:
+                    if not self._is_next(ticket, priority):
+                        self._cond.wait()
+                        continue
+                    wait = self._take_token(priority) if self.bucket else 0
+                    if not wait:
+                        break
+                    self._cond.wait(wait)
+                self._dispatch(session_id, priority)
+            except BaseException:
+                self._remove(ticket, session_id, priority)
+                self._cond.notify_all()
+                raise
+            finally:
+                set_gauge("docsearch_quota_queue_depth", self._queued(priority), priority=priority)
+
+            waited = time.monotonic() - enqueued_at
+            stats = self._stats[priority]
+            stats["dispatched"] += 1
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+            self._cond.notify_all()
+
+        observe("docsearch_quota_wait_seconds", waited, priority=priority, call=call)
+        if waited > 1:
+            logger.debug(f"Quota scheduler: {priority} {call} call for session {session_id} waited {waited:.2f}s")
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, call, session_id=None, priority=INTERACTIVE):
+        self.acquire(call, session_id, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """Queue depth, concurrency and wait-time statistics per priority class"""
+        with self._cond:
+            priorities = {}
+            for priority in PRIORITIES:
+                stats = self._stats[priority]
+                priorities[priority] = {
+                    "queued": self._queued(priority),
+                    "queued_sessions": len(self._queues[priority]),
+                    "dispatched": stats["dispatched"],
+                    "avg_wait_seconds": stats["wait_total"] / stats["dispatched"] if stats["dispatched"] else 0.0,
+                    "max_wait_seconds": stats["wait_max"],
+                }
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "interactive_reserve": self.interactive_reserve,
+                "requests_per_minute": self.requests_per_minute,
+                "shared_rate_limit": self.shared,
+                "priorities": priorities,
+            }
+
+def get_scheduler():
+    """Return the process-wide scheduler, creating it on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = QuotaScheduler(
+                    QUOTA_MAX_CONCURRENCY,
+                    interactive_reserve=QUOTA_INTERACTIVE_RESERVE,
+                    requests_per_minute=QUOTA_REQUESTS_PER_MINUTE,
+                    burst=QUOTA_BURST,
+                    state_file=QUOTA_STATE_FILE,
+                )
+    return _scheduler
+
+def provider_slot(call, session_id=None, priority=None):
+    """Wait for quota before a provider call: `with provider_slot("embedding"): ...`.
+
+    Session and priority default to the enclosing quota_context (interactive, no session).
+    """
+    if not QUOTA_SCHEDULER_ENABLED:
+        return nullcontext()
+    context_session_id, context_priority = _quota_context.get()
+    return get_scheduler().slot(
+        call,
+        session_id if session_id is not None else context_session_id,
+        priority or context_priority,
+    )
+
+def quota_stats():
+    if not QUOTA_SCHEDULER_ENABLED:
+        return {"enabled": False}
+    return dict(get_scheduler().stats(), enabled=True)
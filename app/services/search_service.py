@@ -0,0 +1,20 @@
+from app.config import RAG_CONTEXT_SIZE
+from app.logger import logger
+from app.metrics import span
+from app.services.llm_service import generate_embedding
+from app.services.quota_service import quota_context, INTERACTIVE
+from app.services.vector_service import search_vectors
+
+def search_documents(query, session_id, limit=10):
+    """Embed a query and return the matching points for a session"""
+    logger.info(f"Searching for session {session_id}: '{query}'")
+    with span("query"), quota_context(session_id, INTERACTIVE):
+        query_vector = generate_embedding(query)
+        return search_vectors(query_vector, session_id, limit=limit)
+
+def build_context_text(results, context_size=RAG_CONTEXT_SIZE):
+    """Combine document snippets and image descriptions into a RAG context"""
+    return "\n\n".join([
+        f"[{res.payload.get('source_type', 'unknown')}] {res.payload.get('document', '')}"
+        for res in results[:context_size]
+    ])
@@ -0,0 +1,154 @@
+import json
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from app.config import EMBEDDING_DIM, SNAPSHOT_BATCH_SIZE, SNAPSHOT_RESTORE_WORKERS, SNAPSHOT_QUANTIZE
+from app.logger import logger
+from app.metrics import span
+from app.services.vector_service import ensure_collection, iter_session_points, upsert_batch, stable_point_id, update_last_activity
+
+# A snapshot is a zip archive of shards, each holding one scroll page in columnar form:
+#   meta.json                  format, version, source session, dimension, vector dtype, point/shard counts
+#   NNNNN/ids.npy              point IDs (unicode array)
+#   NNNNN/vectors.npy          float32 vectors, or int8 vectors when quantized
+#   NNNNN/scales.npy           per-vector float32 scale (int8 snapshots only)
+#   NNNNN/payloads.json        {key: [value per point]}, None where a point has no such key
+# Arrays are written with allow_pickle=False, so loading a snapshot never executes code.
+SNAPSHOT_FORMAT = "docsearch-snapshot"
+SNAPSHOT_VERSION = 1
+
+def _quantize(vectors):
+    """Symmetric per-vector int8 quantization. Returns (int8 vectors, float32 scales)."""
+    import numpy as np
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+def _write_array(archive, name, array):
+    import numpy as np
+    with archive.open(name, "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, array, allow_pickle=False)
+
+def _read_array(archive, name):
+    import numpy as np
+    with archive.open(name) as f:
+        return np.lib.format.read_array(f, allow_pickle=False)
+
+def _payload_columns(payloads):
+    keys = sorted({key for payload in payloads for key in payload})
+    return {key: [payload.get(key) for payload in payloads] for key in keys}
+
+def _payload_rows(columns, count):
+    rows = [{} for _ in range(count)]
+    for key, values in columns.items():
+        for row, value in zip(rows, values):
+            if value is not None:
+                row[key] = value
+    return rows
+
+def export_session_snapshot(session_id, destination, quantize=SNAPSHOT_QUANTIZE, page_size=SNAPSHOT_BATCH_SIZE):
+    """Stream a session's vectors and payloads into a compressed snapshot. Returns the number of points written."""
+    import numpy as np
+    point_count = 0
+    shard = 0
+    with span("snapshot_export"), zipfile.ZipFile(destination, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for records in iter_session_points(session_id, page_size=page_size):
+            vectors = np.asarray([record.vector for record in records], dtype=np.float32)
+            prefix = f"{shard:05d}"
+            _write_array(archive, f"{prefix}/ids.npy", np.asarray([str(record.id) for record in records]))
+            if quantize:
+                vectors, scales = _quantize(vectors)
+                _write_array(archive, f"{prefix}/scales.npy", scales)
+            _write_array(archive, f"{prefix}/vectors.npy", vectors)
+            archive.writestr(f"{prefix}/payloads.json", json.dumps(_payload_columns([record.payload or {} for record in records])))
+            point_count += len(records)
+            shard += 1
+
+        archive.writestr("meta.json", json.dumps({
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "session_id": session_id,
+            "dim": EMBEDDING_DIM,
+            "dtype": "int8" if quantize else "float32",
+            "points": point_count,
+            "shards": shard,
+            "created_at": time.time(),
+        }))
+    logger.info(f"Exported {point_count} points of session {session_id} in {shard} shard(s)")
+    return point_count
+
+def _read_meta(archive):
+    try:
+        meta = json.loads(archive.read("meta.json"))
+    except KeyError:
+        raise ValueError("Not a session snapshot: meta.json is missing")
+    if meta.get("format") != SNAPSHOT_FORMAT or meta.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot format: {meta.get('format')} v{meta.get('version')}")
+    if meta.get("dim") != EMBEDDING_DIM:
+        raise ValueError(f"Snapshot dimension {meta.get('dim')} does not match EMBEDDING_DIM {EMBEDDING_DIM}")
+    return meta
+
+def _read_shard(archive, shard, meta):
+    prefix = f"{shard:05d}"
+    try:
+        ids = _read_array(archive, f"{prefix}/ids.npy").tolist()
+        vectors = _read_array(archive, f"{prefix}/vectors.npy")
+        if meta["dtype"] == "int8":
+            vectors = vectors.astype("float32") * _read_array(archive, f"{prefix}/scales.npy")[:, None]
+        payloads = _payload_rows(json.loads(archive.read(f"{prefix}/payloads.json")), len(ids))
+    except KeyError as e:
+        raise ValueError(f"Snapshot shard {prefix} is incomplete: {e}")
+    return ids, vectors, payloads
+
+def _remap_point_id(point_id, payload, session_id, occurrences):
+    """Point ID the ingestion pipeline would have given this point in session_id, so re-uploads stay incremental."""
+    content_hash = payload.get("content_hash")
+    if content_hash and payload.get("source_type") in ("image_description", "image_skipped"):
+        return stable_point_id(session_id, payload.get("source_filename"), "image", content_hash)
+    if content_hash and payload.get("source_type") == "document":
+        key = (payload.get("filename"), content_hash)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        return stable_point_id(session_id, payload.get("filename"), content_hash, occurrence)
+    return stable_point_id(session_id, "snapshot", point_id)
+
+def restore_session_snapshot(source, session_id=None, workers=SNAPSHOT_RESTORE_WORKERS, batch_size=SNAPSHOT_BATCH_SIZE):
+    """Restore a snapshot into session_id (default: the session it was taken from) without re-embedding.
+
+    Shards are decoded one at a time and upserted in parallel batches; at most two batches per
+    worker are in flight, so memory stays bounded for large sessions. Returns (session_id, points restored).
+    """
+    restored = 0
+    with span("snapshot_restore"), zipfile.ZipFile(source) as archive:
+        meta = _read_meta(archive)
+        try:
+            ensure_collection()
+        except ValueError as e:
+            # A misconfigured collection is a server problem, not an invalid snapshot
+            raise RuntimeError(f"Qdrant collection is not usable: {e}")
+        target_session_id = session_id or meta["session_id"]
+        remap = target_session_id != meta["session_id"]
+        occurrences = {}
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            pending = []
+            for shard in range(meta["shards"]):
+                ids, vectors, payloads = _read_shard(archive, shard, meta)
+                for i, payload in enumerate(payloads):
+                    if remap:
+                        ids[i] = _remap_point_id(ids[i], payload, target_session_id, occurrences)
+                    payload["session_id"] = target_session_id
+
+                for start in range(0, len(ids), batch_size):
+                    end = start + batch_size
+                    pending.append(pool.submit(upsert_batch, ids[start:end], vectors[start:end].tolist(), payloads[start:end]))
+                    restored += len(ids[start:end])
+                    while len(pending) > workers * 2:
+                        pending.pop(0).result()
+            for future in pending:
+                future.result()
+
+    update_last_activity(target_session_id)
+    logger.info(f"Restored {restored} points from snapshot of session {meta['session_id']} into session {target_session_id}")
+    return target_session_id, restored
@@ -1,95 +1,219 @@
-from qdrant_client import QdrantClient
 import time
+import uuid
+import threading
 from datetime import datetime
-from qdrant_client.http.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, PayloadSchemaType
-from app.config import QDRANT_URL, QDRANT_API_KEY, QDRANT_COLLECTION, EMBEDDING_DIM, STORAGE_TIMEOUT_MINUTES
+from app.config import QDRANT_URL, QDRANT_PATH, QDRANT_API_KEY, QDRANT_COLLECTION, EMBEDDING_DIM, STORAGE_TIMEOUT_MINUTES, require_config
 from app.logger import logger
+from app.metrics import span, inc
 
-def get_qdrant_client():
-    return QdrantClient(
-        url=QDRANT_URL,
-        api_key=QDRANT_API_KEY,
-    )
+# Payload fields filtered on by sessions, file re-ingestion and cleanup
+KEYWORD_INDEX_FIELDS = ["session_id", "source_type", "filename", "source_filename"]
+
+# Namespace for deterministic point IDs derived from content hashes
+POINT_ID_NAMESPACE = uuid.UUID("6f1c8e52-3b9a-4d0e-9a57-2c4f1d7b8e30")
+
+_qdrant_client = None
+_qdrant_client_lock = threading.Lock()
 
-qdrant_client = get_qdrant_client()
+def stable_point_id(*parts):
+    """Deterministic point ID for the given parts, so re-upserting the same content overwrites instead of duplicating."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, "/".join(str(part) for part in parts)))
+
+def get_qdrant_client():
+    """Return the shared Qdrant client, creating it on first use."""
+    global _qdrant_client
+    if _qdrant_client is None:
+        with _qdrant_client_lock:
+            if _qdrant_client is None:
+                from qdrant_client import QdrantClient
+                if QDRANT_PATH:
+                    _qdrant_client = QdrantClient(path=QDRANT_PATH)
+                elif QDRANT_URL == ":memory:":
+                    _qdrant_client = QdrantClient(location=":memory:")
+                else:
+                    require_config(QDRANT_URL=QDRANT_URL)
+                    _qdrant_client = QdrantClient(
+                        url=QDRANT_URL,
+                        api_key=QDRANT_API_KEY,
+                    )
+    return _qdrant_client
 
 def ensure_collection():
+    from qdrant_client.http.models import Distance, VectorParams, PayloadSchemaType
     try:
-        collections = qdrant_client.get_collections().collections
+        require_config(QDRANT_COLLECTION=QDRANT_COLLECTION, EMBEDDING_DIM=EMBEDDING_DIM)
+        collections = get_qdrant_client().get_collections().collections
         collection_names = [c.name for c in collections]
         if QDRANT_COLLECTION not in collection_names:
-            qdrant_client.create_collection(
+            get_qdrant_client().create_collection(
                 collection_name=QDRANT_COLLECTION,
                 vectors_config=VectorParams(size=EMBEDDING_DIM, distance=Distance.COSINE)
             )
             logger.info(f"Created '{QDRANT_COLLECTION}' with dimension {EMBEDDING_DIM}")
             
             # Create payload indexes for efficient filtering
-            qdrant_client.create_payload_index(
-                collection_name=QDRANT_COLLECTION,
-                field_name="session_id",
-                field_schema=PayloadSchemaType.KEYWORD
-            )
-            qdrant_client.create_payload_index(
-                collection_name=QDRANT_COLLECTION,
-                field_name="source_type",
-                field_schema=PayloadSchemaType.KEYWORD
-            )
-            logger.info("Created payload indexes for 'session_id' and 'source_type'")
+            for field_name in KEYWORD_INDEX_FIELDS:
+                get_qdrant_client().create_payload_index(
+                    collection_name=QDRANT_COLLECTION,
+                    field_name=field_name,
+                    field_schema=PayloadSchemaType.KEYWORD
+                )
+            logger.info(f"Created payload indexes for {', '.join(KEYWORD_INDEX_FIELDS)}")
         else:
             # Check for dimension mismatch
-            collection_info = qdrant_client.get_collection(collection_name=QDRANT_COLLECTION)
+            collection_info = get_qdrant_client().get_collection(collection_name=QDRANT_COLLECTION)
             existing_size = collection_info.config.params.vectors.size
             if existing_size != EMBEDDING_DIM:
                 logger.error(f"Dimension mismatch: '{QDRANT_COLLECTION}' has dimension {existing_size}, but config expects {EMBEDDING_DIM}.")
                 raise ValueError(f"Qdrant Dimension Mismatch: {existing_size} vs {EMBEDDING_DIM}. Please 'Clear Storage' in the app to recreate the collection.")
             
             # Proactively ensure indexes exist on the existing collection
-            try:
-                qdrant_client.create_payload_index(
-                    collection_name=QDRANT_COLLECTION,
-                    field_name="session_id",
-                    field_schema=PayloadSchemaType.KEYWORD
-                )
-                qdrant_client.create_payload_index(
-                    collection_name=QDRANT_COLLECTION,
-                    field_name="source_type",
-                    field_schema=PayloadSchemaType.KEYWORD
-                )
-            except Exception as index_err:
-                # Qdrant might throw if already exists, we can log and continue
-                logger.debug(f"Index check/creation on existing collection: {index_err}")
+            for field_name in KEYWORD_INDEX_FIELDS:
+                try:
+                    get_qdrant_client().create_payload_index(
+                        collection_name=QDRANT_COLLECTION,
+                        field_name=field_name,
+                        field_schema=PayloadSchemaType.KEYWORD
+                    )
+                except Exception as index_err:
+                    # Qdrant might throw if already exists, we can log and continue
+                    logger.debug(f"Index check/creation on existing collection: {index_err}")
     except Exception as e:
         logger.error(f"Failed to check or create Qdrant collection: {str(e)}")
         raise
 
 def upsert_points(points):
     try:
-        qdrant_client.upsert(collection_name=QDRANT_COLLECTION, points=points)
+        with span("upsert"):
+            get_qdrant_client().upsert(collection_name=QDRANT_COLLECTION, points=points)
+        inc("docsearch_points_upserted_total", len(points))
         logger.info(f"Stored {len(points)} points in Qdrant")
     except Exception as e:
         logger.error(f"Failed to upsert points: {str(e)}")
         raise
 
+def get_points_by_payload(session_id, payload_keys=None, page_size=1000, **match):
+    """Returns {point_id: payload} for all points of a session whose payload matches the given key/values."""
+    from qdrant_client.http.models import Filter, FieldCondition, MatchValue
+    conditions = [FieldCondition(key="session_id", match=MatchValue(value=session_id))]
+    conditions += [FieldCondition(key=key, match=MatchValue(value=value)) for key, value in match.items()]
+
+    points = {}
+    offset = None
+    try:
+        while True:
+            records, offset = get_qdrant_client().scroll(
+                collection_name=QDRANT_COLLECTION,
+                scroll_filter=Filter(must=conditions),
+                limit=page_size,
+                offset=offset,
+                with_payload=payload_keys if payload_keys else True,
+                with_vectors=False
+            )
+            for record in records:
+                points[str(record.id)] = record.payload or {}
+            if offset is None:
+                return points
+    except Exception as e:
+        logger.error(f"Failed to retrieve points for session {session_id}: {e}")
+        return {}
+
+def iter_session_points(session_id, page_size=1000, with_vectors=True):
+    """Yields a session's points page by page, skipping the activity marker."""
+    from qdrant_client.http.models import Filter, FieldCondition, MatchValue
+    session_filter = Filter(
+        must=[FieldCondition(key="session_id", match=MatchValue(value=session_id))],
+        must_not=[FieldCondition(key="source_type", match=MatchValue(value="activity_marker"))]
+    )
+    offset = None
+    while True:
+        records, offset = get_qdrant_client().scroll(
+            collection_name=QDRANT_COLLECTION,
+            scroll_filter=session_filter,
+            limit=page_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=with_vectors
+        )
+        if records:
+            yield records
+        if offset is None:
+            return
+
+def upsert_batch(ids, vectors, payloads):
+    """Upserts columnar points (parallel lists) without building a PointStruct per point."""
+    from qdrant_client.http.models import Batch
+    try:
+        with span("upsert"):
+            get_qdrant_client().upsert(
+                collection_name=QDRANT_COLLECTION,
+                points=Batch(ids=ids, vectors=vectors, payloads=payloads)
+            )
+        inc("docsearch_points_upserted_total", len(ids))
+    except Exception as e:
+        logger.error(f"Failed to upsert batch of {len(ids)} points: {str(e)}")
+        raise
+
+def delete_points(point_ids):
+    """Deletes specific points by ID."""
+    from qdrant_client.http.models import PointIdsList
+    if not point_ids:
+        return
+    try:
+        get_qdrant_client().delete(
+            collection_name=QDRANT_COLLECTION,
+            points_selector=PointIdsList(points=list(point_ids))
+        )
+        logger.info(f"Deleted {len(point_ids)} points from Qdrant")
+    except Exception as e:
+        logger.error(f"Failed to delete points: {str(e)}")
+        raise
+
+def set_payloads(updates):
+    """Updates payload fields of existing points in one batch. updates is a list of (point_id, payload) pairs."""
+    from qdrant_client.http.models import SetPayloadOperation, SetPayload
+    if not updates:
+        return
+    try:
+        get_qdrant_client().batch_update_points(
+            collection_name=QDRANT_COLLECTION,
+            update_operations=[
+                SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[point_id]))
+                for point_id, payload in updates
+            ]
+        )
+        logger.info(f"Updated payload of {len(updates)} points in Qdrant")
+    except Exception as e:
+        logger.error(f"Failed to update payloads: {str(e)}")
+        raise
+
 def search_vectors(query_vector, session_id, limit=5):
+    from qdrant_client.http.models import Filter, FieldCondition, MatchValue, MatchAny
     try:
-        # Create a filter to only search within the specific session
+        # Create a filter to only search within the specific session, skipping zero-vector bookkeeping points
         search_filter = Filter(
             must=[
                 FieldCondition(
                     key="session_id",
                     match=MatchValue(value=session_id)
                 )
+            ],
+            must_not=[
+                FieldCondition(
+                    key="source_type",
+                    match=MatchAny(any=["activity_marker", "image_skipped"])
+                )
             ]
         )
         
-        search_result = qdrant_client.query_points(
-            collection_name=QDRANT_COLLECTION,
-            query=query_vector,
-            query_filter=search_filter,
-            limit=limit,
-            with_payload=True
-        )
+        with span("search"):
+            search_result = get_qdrant_client().query_points(
+                collection_name=QDRANT_COLLECTION,
+                query=query_vector,
+                query_filter=search_filter,
+                limit=limit,
+                with_payload=True
+            )
         return search_result.points
     except Exception as e:
         logger.error(f"Error searching documents for session {session_id}: {e}")
@@ -97,8 +221,9 @@ def search_vectors(query_vector, session_id, limit=5):
 
 def delete_session_data(session_id):
     """Deletes all points belonging to a specific session."""
+    from qdrant_client.http.models import Filter, FieldCondition, MatchValue
     try:
-        qdrant_client.delete(
+        get_qdrant_client().delete(
             collection_name=QDRANT_COLLECTION,
             points_selector=Filter(
                 must=[
@@ -116,7 +241,7 @@ def delete_session_data(session_id):
 
 def delete_collection():
     try:
-        qdrant_client.delete_collection(collection_name=QDRANT_COLLECTION)
+        get_qdrant_client().delete_collection(collection_name=QDRANT_COLLECTION)
         logger.info(f"Deleted '{QDRANT_COLLECTION}'")
     except Exception as e:
         logger.error(f"Failed to delete collection: {str(e)}")
@@ -124,6 +249,7 @@ def delete_collection():
 
 def update_last_activity(session_id):
     """Updates a marker in Qdrant with the current timestamp for a specific session."""
+    from qdrant_client.http.models import PointStruct
     try:
         # We use a zero-vector and the session_id (which is a UUID) for the activity marker
         marker_id = session_id
@@ -138,7 +264,7 @@ def update_last_activity(session_id):
                 "human_readable": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
         )
-        qdrant_client.upsert(collection_name=QDRANT_COLLECTION, points=[point])
+        get_qdrant_client().upsert(collection_name=QDRANT_COLLECTION, points=[point])
         logger.debug(f"Updated activity for session {session_id}: {timestamp}")
     except Exception as e:
         logger.warning(f"Failed to update activity marker for session {session_id}: {e}")
@@ -147,11 +273,11 @@ def check_auto_cleanup(session_id):
     """Checks if the session's data should be cleared due to inactivity."""
     try:
         marker_id = session_id
-        collections = qdrant_client.get_collections().collections
+        collections = get_qdrant_client().get_collections().collections
         if not any(c.name == QDRANT_COLLECTION for c in collections):
             return
 
-        result = qdrant_client.retrieve(
+        result = get_qdrant_client().retrieve(
             collection_name=QDRANT_COLLECTION,
             ids=[marker_id],
             with_payload=True
@@ -173,7 +299,7 @@ def get_last_activity(session_id):
     """Retrieves the last activity timestamp for a session."""
     try:
         marker_id = session_id
-        result = qdrant_client.retrieve(
+        result = get_qdrant_client().retrieve(
             collection_name=QDRANT_COLLECTION,
             ids=[marker_id],
             with_payload=True
@@ -186,8 +312,9 @@ def get_last_activity(session_id):
 
 def get_session_filenames(session_id):
     """Retrieves unique filenames uploaded for a given session."""
+    from qdrant_client.http.models import Filter, FieldCondition, MatchValue
     try:
-        result_points, _ = qdrant_client.scroll(
+        result_points, _ = get_qdrant_client().scroll(
             collection_name=QDRANT_COLLECTION,
             scroll_filter=Filter(
                 must=[
@@ -220,13 +347,14 @@ def get_session_filenames(session_id):
 
 def perform_global_cleanup():
     """Scans for and deletes ALL expired sessions in the whole collection."""
+    from qdrant_client.http.models import Filter, FieldCondition, MatchValue
     try:
-        collections = qdrant_client.get_collections().collections
+        collections = get_qdrant_client().get_collections().collections
         if not any(c.name == QDRANT_COLLECTION for c in collections):
             return
 
         # Search for all activity markers
-        markers = qdrant_client.scroll(
+        markers = get_qdrant_client().scroll(
             collection_name=QDRANT_COLLECTION,
             scroll_filter=Filter(
                 must=[
@@ -0,0 +1,80 @@
+"""Throughput benchmark: offset-based chunker vs LangChain's RecursiveCharacterTextSplitter.
+
+Checks that both produce identical chunks on a synthetic corpus, then reports
+MB/s and chunks/s for each.
+
+Usage:
+    python benchmarks/chunking_benchmark.py [--size-mb 5] [--repeat 3] [--chunk-size 1000] [--overlap 100]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.extraction_service import create_chunk_spans, create_chunks
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+         "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua", "revenue",
+         "quarterly", "forecast", "x" * 40]
+
+def synthetic_text(size_bytes, seed=42):
+    """Build paragraphs of varying length, with occasional long lines and words, up to size_bytes."""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    while total < size_bytes:
+        lines = []
+        for _ in range(rng.randint(1, 8)):
+            lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 60 if rng.random() > 0.05 else 600))))
+        paragraph = "\n".join(lines)
+        parts.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(parts)
+
+def best_of(repeat, fn):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the offset-based chunker against LangChain")
+    parser.add_argument("--size-mb", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=100)
+    args = parser.parse_args()
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text = synthetic_text(int(args.size_mb * 1024 * 1024))
+    size_mb = len(text) / (1024 * 1024)
+    print(f"Corpus: {size_mb:.2f} MB, chunk_size={args.chunk_size}, overlap={args.overlap}, best of {args.repeat}")
+
+    def langchain_split():
+        splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.overlap, length_function=len)
+        return splitter.split_text(text)
+
+    lc_time, lc_chunks = best_of(args.repeat, langchain_split)
+    span_time, spans = best_of(args.repeat, lambda: create_chunk_spans(text, args.chunk_size, args.overlap))
+    str_time, chunks = best_of(args.repeat, lambda: create_chunks(text, args.chunk_size, args.overlap))
+
+    if chunks != lc_chunks:
+        mismatch = next((i for i, (a, b) in enumerate(zip(chunks, lc_chunks)) if a != b), min(len(chunks), len(lc_chunks)))
+        print(f"MISMATCH: {len(chunks)} vs {len(lc_chunks)} chunks, first difference at chunk {mismatch}")
+        sys.exit(1)
+
+    print(f"Output identical: {len(spans)} chunks\n")
+    print(f"{'chunker':<28}{'seconds':>10}{'MB/s':>10}{'chunks/s':>14}")
+    for name, elapsed in [("langchain split_text", lc_time), ("create_chunk_spans (spans)", span_time), ("create_chunks (strings)", str_time)]:
+        print(f"{name:<28}{elapsed:>10.3f}{size_mb / elapsed:>10.2f}{len(spans) / elapsed:>14.0f}")
+    print(f"\nSpan speedup over LangChain: {lc_time / span_time:.2f}x")
+
+if __name__ == "__main__":
+    main()
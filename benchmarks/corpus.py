@@ -0,0 +1,73 @@
+"""Synthetic corpora for the offline benchmarks: large text PDFs, image-heavy PDFs and wide spreadsheets."""
+import io
+import os
+import random
+
+WORDS = ["revenue", "forecast", "quarter", "growth", "margin", "customer", "pipeline", "region", "segment",
+         "invoice", "contract", "renewal", "churn", "budget", "headcount", "capacity", "latency", "throughput"]
+
+def _sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + "."
+
+def _paragraph(rng):
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+
+def make_text_pdf(path, pages, seed=1):
+    """A text-layer PDF with a few paragraphs per page."""
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        text = "\n\n".join(_paragraph(rng) for _ in range(4))
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), text, fontsize=9)
+    doc.save(path)
+    doc.close()
+    return path
+
+def make_image_pdf(path, pages, seed=2):
+    """A PDF where every page has a caption and a large image, so each page goes to the vision model."""
+    import fitz
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 40, page.rect.width - 50, 120), _paragraph(rng), fontsize=9)
+
+        image = Image.new("RGB", (800, 500), "white")
+        draw = ImageDraw.Draw(image)
+        for bar in range(8):
+            height = rng.randint(40, 460)
+            draw.rectangle([40 + bar * 90, 480 - height, 100 + bar * 90, 480], fill=(30 * bar % 255, 90, 160))
+        draw.text((20, 10), f"Figure {page_num + 1}", fill="black")
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        page.insert_image(fitz.Rect(50, 140, page.rect.width - 50, 520), stream=buffer.getvalue())
+    doc.save(path)
+    doc.close()
+    return path
+
+def make_wide_xlsx(path, rows, columns, seed=3):
+    """A single-sheet workbook with a header row and many numeric/text columns, written in write-only mode."""
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Data")
+    sheet.append([f"col_{i}_{rng.choice(WORDS)}" for i in range(columns)])
+    for row in range(rows):
+        sheet.append([rng.randint(0, 10000) if i % 3 else rng.choice(WORDS) for i in range(columns)])
+    workbook.save(path)
+    return path
+
+def make_corpus(directory, text_pages=200, image_pages=20, sheet_rows=2000, sheet_columns=60):
+    """Generate the benchmark corpus in directory. Returns {name: path}."""
+    os.makedirs(directory, exist_ok=True)
+    return {
+        "text_pdf": make_text_pdf(os.path.join(directory, "large_text.pdf"), text_pages),
+        "image_pdf": make_image_pdf(os.path.join(directory, "image_heavy.pdf"), image_pages),
+        "wide_xlsx": make_wide_xlsx(os.path.join(directory, "wide_sheet.xlsx"), sheet_rows, sheet_columns),
+    }
@@ -0,0 +1,71 @@
+"""Deterministic stand-ins for the litellm embedding and completion APIs.
+
+install_fake_litellm() registers a fake ``litellm`` module in ``sys.modules``;
+the services import litellm lazily, so they pick it up without any other change.
+Each call sleeps for a configurable latency to model the provider round trip.
+"""
+import sys
+import time
+import types
+import hashlib
+import threading
+from types import SimpleNamespace
+
+class FakeProviders:
+    """Fake embedding/vision/completion endpoints with per-call latency and call counters."""
+
+    def __init__(self, dim, embed_latency_s=0.0, vision_latency_s=0.0, completion_latency_s=0.0):
+        self.dim = dim
+        self.embed_latency_s = embed_latency_s
+        self.vision_latency_s = vision_latency_s
+        self.completion_latency_s = completion_latency_s
+        self.calls = {"embedding": 0, "vision": 0, "completion": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+
+    def vector(self, text):
+        """Deterministic unit-ish vector derived from the text hash"""
+        digest = hashlib.blake2b(text.encode("utf-8", errors="replace"), digest_size=64).digest()
+        repeated = (digest * (self.dim // len(digest) + 1))[:self.dim]
+        return [(byte - 127.5) / 127.5 for byte in repeated]
+
+    def embedding(self, input, model=None, api_key=None, **kwargs):
+        self._count("embedding")
+        if self.embed_latency_s:
+            time.sleep(self.embed_latency_s)
+        return {"data": [{"embedding": self.vector(text), "index": i} for i, text in enumerate(input)]}
+
+    def completion(self, model=None, messages=None, api_key=None, stream=False, **kwargs):
+        content = messages[-1]["content"] if messages else ""
+        is_vision = isinstance(content, list) and any(part.get("type") == "image_url" for part in content)
+        prompt = " ".join(part.get("text", "") for part in content) if isinstance(content, list) else str(content)
+
+        if is_vision:
+            self._count("vision")
+            latency = self.vision_latency_s
+            answer = f"Chart describing quarterly figures, fingerprint {hashlib.md5(str(content).encode()).hexdigest()[:12]}."
+        else:
+            self._count("completion")
+            latency = self.completion_latency_s
+            answer = f"Synthetic answer based on {len(prompt)} characters of context."
+        if latency:
+            time.sleep(latency)
+
+        if stream:
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))]) for word in answer.split()])
+        return {
+            "choices": [{"message": {"content": answer}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(answer) // 4},
+        }
+
+def install_fake_litellm(providers):
+    """Register a fake 'litellm' module backed by the given providers."""
+    module = types.ModuleType("litellm")
+    module.embedding = providers.embedding
+    module.completion = providers.completion
+    module.__fake__ = True
+    sys.modules["litellm"] = module
+    return module
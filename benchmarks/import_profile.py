@@ -0,0 +1,93 @@
+"""Import-time profile of the application modules.
+
+Runs each module import in a fresh interpreter with ``python -X importtime`` and
+reports the wall time plus the slowest imports by cumulative time.
+
+Usage:
+    python benchmarks/import_profile.py [--top 15] [--json results.json] [module ...]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "app.config",
+    "app.services.extraction_service",
+    "app.services.llm_service",
+    "app.services.vector_service",
+    "app.services.image_service",
+    "app.services.ingestion_service",
+    "app.services.search_service",
+]
+
+def parse_importtime(stderr):
+    """Parse '-X importtime' output into (module, self_us, cumulative_us) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line.split("|", 2)
+            self_us = int(self_us.replace("import time:", "").strip())
+            rows.append((name.strip(), self_us, int(cumulative_us.strip())))
+        except ValueError:
+            continue
+    return rows
+
+def profile_module(module):
+    """Import a module in a fresh interpreter and return its import-time profile."""
+    env = os.environ.copy()
+    env["PYTHONPATH"] = ROOT_DIR + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall_s = time.perf_counter() - start
+    rows = parse_importtime(proc.stderr)
+    total_us = max((cumulative for name, _, cumulative in rows if name == module), default=0)
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode != 0 and proc.stderr.strip() else None,
+        "wall_s": round(wall_s, 4),
+        "import_s": round(total_us / 1e6, 4),
+        "slowest": sorted(rows, key=lambda row: row[2], reverse=True),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile import time of the application modules")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list per module")
+    parser.add_argument("--json", dest="json_path", help="Write the full report to this JSON file")
+    args = parser.parse_args()
+
+    report = []
+    for module in args.modules:
+        result = profile_module(module)
+        result["slowest"] = [
+            {"module": name, "self_s": round(self_us / 1e6, 4), "cumulative_s": round(cumulative_us / 1e6, 4)}
+            for name, self_us, cumulative_us in result["slowest"][:args.top]
+        ]
+        report.append(result)
+
+        status = "ok" if result["ok"] else f"FAILED ({result['error']})"
+        print(f"\n{module}: import {result['import_s']:.3f}s, interpreter wall {result['wall_s']:.3f}s [{status}]")
+        for row in result["slowest"]:
+            print(f"    {row['cumulative_s']:8.3f}s  {row['module']}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Offline benchmark suite for the ingestion and retrieval paths.
+
+Runs entirely without network access: litellm is replaced by deterministic fake
+providers with configurable latency (see fake_providers.py) and Qdrant runs
+in-memory (or on local disk with --qdrant local). Reports per-stage throughput,
+query latency percentiles and peak RSS, and writes a JSON result file that can
+be compared across commits.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--quick] [--embed-latency-ms 5] [--compare benchmarks/results/<old>.json]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.fake_providers import FakeProviders, install_fake_litellm
+from benchmarks.corpus import make_corpus
+
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+def configure_environment(args, workdir):
+    """Point the app at fake providers and a local Qdrant before app.config is imported."""
+    os.environ.update({
+        "GEMINI_API_KEY": "offline-benchmark",
+        "EMBEDDING_MODEL": "fake/embedding",
+        "IMAGE_MODEL": "fake/vision",
+        "RAG_MODEL": "fake/completion",
+        "EMBEDDING_DIM": str(args.dim),
+        "CHUNK_SIZE": str(args.chunk_size),
+        "CHUNK_OVERLAP": str(args.chunk_overlap),
+        "QDRANT_COLLECTION": "benchmark",
+        "QDRANT_URL": ":memory:",
+        "QDRANT_API_KEY": "",
+        "IMAGE_REQUEST_DELAY_SECONDS": "0",
+        "IMAGE_PROMPT": "Describe the image.",
+        "RAG_SYSTEM_PROMPT": "Answer from the context.",
+        "OCR_ENABLED": "true" if args.ocr else "false",
+        "OCR_CACHE_DIR": os.path.join(workdir, "ocr_cache"),
+    })
+    if args.qdrant == "local":
+        os.environ["QDRANT_PATH"] = os.path.join(workdir, "qdrant")
+    else:
+        os.environ.pop("QDRANT_PATH", None)
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return round(usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024, 1)
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+def stage_result(seconds, **counts):
+    """Throughput per counted unit for a stage, e.g. pages=200 -> pages_per_s"""
+    result = {"seconds": round(seconds, 4), "peak_rss_mb": peak_rss_mb()}
+    for unit, count in counts.items():
+        result[unit] = count
+        result[f"{unit}_per_s"] = round(count / seconds, 2) if seconds > 0 else None
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def run_suite(args, corpus):
+    # App modules are imported only after the environment and fake litellm are in place
+    from app.services.vector_service import ensure_collection, upsert_points
+    from app.services.extraction_service import extract_pdf_pages, join_pages, create_chunk_spans, create_table_chunks
+    from app.services.llm_service import generate_embedding, get_rag_answer
+    from app.services.image_service import process_pdf_images_and_store
+    from app.services.ingestion_service import ingest_file
+    from app.services.search_service import search_documents, build_context_text
+    from qdrant_client.http.models import PointStruct
+
+    ensure_collection()
+    session_id = str(uuid.uuid4())
+    stages = {}
+
+    # --- Stage-by-stage on the large text PDF ---
+    seconds, pages = timed(lambda: extract_pdf_pages(corpus["text_pdf"]))
+    stages["extract_pdf"] = stage_result(seconds, pages=len(pages))
+
+    text, page_starts = join_pages(page_text for _, page_text, _ in pages)
+    seconds, spans = timed(lambda: create_chunk_spans(text, page_starts=page_starts))
+    stages["chunk"] = stage_result(seconds, chunks=len(spans), mb=round(len(text) / (1024 * 1024), 3))
+
+    chunks = [text[start:end] for start, end, _ in spans]
+    seconds, vectors = timed(lambda: [generate_embedding(chunk) for chunk in chunks])
+    stages["embed"] = stage_result(seconds, vectors=len(vectors))
+
+    points = [
+        PointStruct(id=str(uuid.uuid4()), vector=vector, payload={"filename": "stage.pdf", "document": chunk, "source_type": "document", "session_id": session_id})
+        for chunk, vector in zip(chunks, vectors)
+    ]
+    def upsert_all():
+        for i in range(0, len(points), args.batch_size):
+            upsert_points(points[i:i + args.batch_size])
+    seconds, _ = timed(upsert_all)
+    stages["upsert"] = stage_result(seconds, vectors=len(points))
+
+    # --- Vision path on the image-heavy PDF ---
+    image_pages = len(extract_pdf_pages(corpus["image_pdf"]))
+    vision_calls_before = args.providers.calls["vision"]
+    seconds, _ = timed(lambda: process_pdf_images_and_store("image_heavy.pdf", corpus["image_pdf"], session_id))
+    stages["vision"] = stage_result(seconds, pages=image_pages, vision_calls=args.providers.calls["vision"] - vision_calls_before)
+
+    # --- Spreadsheet chunking ---
+    seconds, table_chunks = timed(lambda: list(create_table_chunks(corpus["wide_xlsx"])))
+    stages["chunk_table"] = stage_result(seconds, chunks=len(table_chunks), rows=args.sheet_rows)
+
+    # --- End-to-end ingestion ---
+    # Each file goes into a fresh session: stored chunks and image descriptions are reused per session,
+    # so sharing one with the stages above would skip the embedding and vision work being measured
+    query_session_id = str(uuid.uuid4())
+    seconds, stored = timed(lambda: ingest_file(corpus["text_pdf"], "large_text.pdf", query_session_id, process_images=False))
+    stages["ingest_text_pdf"] = stage_result(seconds, pages=len(pages), chunks=stored)
+
+    vision_calls_before = args.providers.calls["vision"]
+    seconds, stored = timed(lambda: ingest_file(corpus["image_pdf"], "image_heavy.pdf", str(uuid.uuid4()), process_images=True))
+    stages["ingest_image_pdf"] = stage_result(seconds, pages=image_pages, chunks=stored, vision_calls=args.providers.calls["vision"] - vision_calls_before)
+
+    seconds, stored = timed(lambda: ingest_file(corpus["wide_xlsx"], "wide_sheet.xlsx", str(uuid.uuid4())))
+    stages["ingest_wide_xlsx"] = stage_result(seconds, rows=args.sheet_rows, chunks=stored)
+
+    # --- Query latency ---
+    queries = [f"{chunks[i % len(chunks)][:60]}" for i in range(args.queries)]
+    search_latencies = []
+    rag_latencies = []
+    for query in queries:
+        seconds, results = timed(lambda: search_documents(query, query_session_id, limit=10))
+        search_latencies.append(seconds)
+        context_text = build_context_text(results)
+        seconds, _ = timed(lambda: get_rag_answer(query, context_text))
+        rag_latencies.append(seconds)
+
+    def latency_summary(latencies):
+        return {
+            "count": len(latencies),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        }
+
+    return {
+        "stages": stages,
+        "query": {"search": latency_summary(search_latencies), "rag": latency_summary(rag_latencies)},
+        "provider_calls": dict(args.providers.calls),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def print_report(report):
+    print(f"\n{'stage':<20}{'seconds':>10}  throughput")
+    for name, stage in report["stages"].items():
+        rates = ", ".join(f"{key[:-6]}/s={value}" for key, value in stage.items() if key.endswith("_per_s"))
+        print(f"{name:<20}{stage['seconds']:>10.3f}  {rates}")
+    for name, summary in report["query"].items():
+        print(f"query {name:<14}p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms mean={summary['mean_ms']}ms (n={summary['count']})")
+    print(f"provider calls: {report['provider_calls']}")
+    print(f"peak RSS: {report['peak_rss_mb']} MB")
+
+def print_comparison(report, baseline_path):
+    """Print per-metric ratios (new / baseline) for throughput and latency."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparison with {baseline_path} ({baseline['meta'].get('git_commit')}):")
+    for name, stage in report["stages"].items():
+        old_stage = baseline.get("stages", {}).get(name, {})
+        for key, value in stage.items():
+            old_value = old_stage.get(key)
+            if key.endswith("_per_s") and value and old_value:
+                print(f"  {name}.{key}: {old_value} -> {value} ({value / old_value:.2f}x)")
+    for name, summary in report["query"].items():
+        old_summary = baseline.get("query", {}).get(name, {})
+        for key in ("p50_ms", "p95_ms"):
+            if summary.get(key) and old_summary.get(key):
+                print(f"  query.{name}.{key}: {old_summary[key]} -> {summary[key]} ({summary[key] / old_summary[key]:.2f}x)")
+    if baseline.get("peak_rss_mb"):
+        print(f"  peak_rss_mb: {baseline['peak_rss_mb']} -> {report['peak_rss_mb']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion and retrieval benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Small corpus for a fast smoke run")
+    parser.add_argument("--text-pages", type=int, default=200)
+    parser.add_argument("--image-pages", type=int, default=20)
+    parser.add_argument("--sheet-rows", type=int, default=2000)
+    parser.add_argument("--sheet-columns", type=int, default=60)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--vision-latency-ms", type=float, default=0.0)
+    parser.add_argument("--completion-latency-ms", type=float, default=0.0)
+    parser.add_argument("--qdrant", choices=["memory", "local"], default="memory")
+    parser.add_argument("--ocr", action="store_true", help="Allow OCR of pages without a text layer")
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.text_pages, args.image_pages, args.sheet_rows, args.queries = 20, 3, 200, 20
+
+    workdir = tempfile.mkdtemp(prefix="docsearch_bench_")
+    configure_environment(args, workdir)
+    args.providers = FakeProviders(
+        dim=args.dim,
+        embed_latency_s=args.embed_latency_ms / 1000,
+        vision_latency_s=args.vision_latency_ms / 1000,
+        completion_latency_s=args.completion_latency_ms / 1000,
+    )
+    install_fake_litellm(args.providers)
+
+    print(f"Generating corpus in {workdir}...")
+    corpus_seconds, corpus = timed(lambda: make_corpus(
+        os.path.join(workdir, "corpus"),
+        text_pages=args.text_pages,
+        image_pages=args.image_pages,
+        sheet_rows=args.sheet_rows,
+        sheet_columns=args.sheet_columns,
+    ))
+
+    report = run_suite(args, corpus)
+    report["meta"] = {
+        "git_commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus_seconds": round(corpus_seconds, 3),
+        "params": {key: value for key, value in vars(args).items() if key not in ("providers", "output", "compare")},
+    }
+    print_report(report)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['meta']['git_commit']}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        print_comparison(report, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -14,8 +14,19 @@ def is_running_in_streamlit():
     except ImportError:
         return False
 
+def run_api_server():
+    """Serve the headless HTTP API with uvicorn"""
+    import uvicorn
+    from app.config import API_HOST, API_PORT, API_WORKERS
+
+    print(f"Launching Document Search API on {API_HOST}:{API_PORT} ({API_WORKERS} worker(s))...")
+    uvicorn.run("api.server:app", host=API_HOST, port=API_PORT, workers=API_WORKERS)
+
 if __name__ == "__main__":
-    if is_running_in_streamlit():
+    if len(sys.argv) > 1 and sys.argv[1] == "api":
+        # We are launching the HTTP API via 'python main.py api'
+        run_api_server()
+    elif is_running_in_streamlit():
         # We are inside a Streamlit process (e.g., Streamlit Cloud or local 'streamlit run')
         from ui.streamlit_app import main
         main()
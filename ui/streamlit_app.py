@@ -1,16 +1,16 @@
+import io
 import streamlit as st
-import tempfile
-import os
 import uuid
 import time
 from datetime import datetime
-from app.config import QDRANT_COLLECTION, RAG_CONTEXT_SIZE, STORAGE_TIMEOUT_MINUTES
+from app.config import RAG_CONTEXT_SIZE, STORAGE_TIMEOUT_MINUTES
 from app.logger import logger
-from app.services.extraction_service import extract_text_from_file, create_chunks
-from app.services.llm_service import generate_embedding, get_rag_answer
-from app.services.vector_service import qdrant_client, ensure_collection, upsert_points, search_vectors, delete_session_data, check_auto_cleanup, update_last_activity, get_last_activity, perform_global_cleanup, get_session_filenames
-from app.services.image_service import process_pdf_images_and_store
-from qdrant_client.http.models import PointStruct
+from app.metrics import start_metrics_exporters
+from app.services.llm_service import get_rag_answer
+from app.services.vector_service import ensure_collection, delete_session_data, check_auto_cleanup, update_last_activity, get_last_activity, perform_global_cleanup, get_session_filenames
+from app.services.ingestion_service import ingest_upload
+from app.services.search_service import search_documents, build_context_text
+from app.services.snapshot_service import export_session_snapshot, restore_session_snapshot
 
 # --- Latency Optimizations ---
 
@@ -20,6 +20,12 @@ def init_qdrant():
     ensure_collection()
     return True
 
+@st.cache_resource
+def init_metrics():
+    """Starts the metrics exporters once per app process (no-op unless METRICS_ENABLED)."""
+    start_metrics_exporters()
+    return True
+
 def run_throttled_cleanup(session_id):
     """Runs cleanups only when necessary to avoid blocking UI actions."""
     # Global cleanup: Run once per browser session start
@@ -74,8 +80,9 @@ def main():
             st.session_state.uploaded_files_list = stored_filenames
             logger.info(f"Restored {len(stored_filenames)} files from Qdrant for session {session_id}")
 
-    # 1. Initialize DB (Cached)
+    # 1. Initialize DB and metrics (Cached)
     init_qdrant()
+    init_metrics()
 
     # 2. Throttled Cleanups (Avoid blocking UI reruns)
     run_throttled_cleanup(session_id)
@@ -95,6 +102,33 @@ def main():
                 st.warning("⚠️ Storage is pending cleanup on refresh.")
         else:
             st.info("No active session data found.")
+
+        # Snapshots let a session outlive auto-cleanup without re-embedding on restore
+        st.subheader("💾 Snapshot")
+        if st.button("Prepare Snapshot"):
+            with st.spinner("Exporting session..."):
+                buffer = io.BytesIO()
+                export_session_snapshot(session_id, buffer)
+                st.session_state.snapshot_bytes = buffer.getvalue()
+        if st.session_state.get('snapshot_bytes'):
+            st.download_button(
+                "Download Snapshot",
+                data=st.session_state.snapshot_bytes,
+                file_name=f"session-{session_id}.snapshot.zip",
+                mime="application/zip"
+            )
+
+        snapshot_file = st.file_uploader("Restore from snapshot", type=["zip"], key=f"snapshot_{st.session_state.uploader_key}")
+        if snapshot_file and st.button("Restore Snapshot"):
+            try:
+                with st.spinner("Restoring session..."):
+                    _, restored = restore_session_snapshot(io.BytesIO(snapshot_file.getvalue()), session_id)
+                st.session_state.uploaded_files_list = get_session_filenames(session_id)
+                cached_get_last_activity.clear()
+                st.success(f"✅ Restored {restored} chunks.")
+            except Exception as e:
+                logger.error(f"Snapshot restore failed: {e}")
+                st.error(f"❌ Could not restore snapshot: {e}")
         
         st.divider()
         st.caption(f"Session isolation is active.")
@@ -167,47 +201,14 @@ def main():
                 
                 start_time = time.time()
 
-                file_ext = uploaded_file.name.split('.')[-1]
-                with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_ext}") as tmp_file:
-                    tmp_file.write(uploaded_file.read())
-                    tmp_path = tmp_file.name
-
-                logger.info(f"Processing file: {uploaded_file.name}")
-
-                # 1. Extract text
-                text = extract_text_from_file(tmp_path)
-                
-                # 2. Vectorize and store text
-                if text:
-                    chunks = create_chunks(text)
-                    points = []
-                    for chunk in chunks:
-                        chunk_embedding = generate_embedding(chunk)
-                        u_id = str(uuid.uuid4())
-                        points.append(PointStruct(
-                            id=u_id,
-                            vector=chunk_embedding,
-                            payload={
-                                "filename": uploaded_file.name,
-                                "document": chunk,
-                                "source_type": "document",
-                                "session_id": session_id
-                            }
-                        ))
-                    if points:
-                        upsert_points(points)
-
-                # 3. Process images if PDF
-                if process_images and file_ext.lower() == "pdf":
-                    try:
-                        process_pdf_images_and_store(uploaded_file, tmp_path, session_id)
-                    except Exception as e:
-                        logger.error(f"Failed to process images: {str(e)}")
+                try:
+                    ingest_upload(uploaded_file.read(), uploaded_file.name, session_id, process_images=process_images)
+                except Exception as e:
+                    st.error(f"Failed to process {uploaded_file.name}: {str(e)}")
+                    continue
 
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-                    
-                st.session_state.uploaded_files_list.append(uploaded_file.name)
+                if uploaded_file.name not in st.session_state.uploaded_files_list:
+                    st.session_state.uploaded_files_list.append(uploaded_file.name)
                 elapsed = time.time() - start_time
                 total_processing_time += elapsed
                 
@@ -228,11 +229,9 @@ def main():
 
     if st.button("Search") and query:
         try:
-            logger.info(f"Searching for session {session_id}: '{query}'")
             update_last_activity(session_id) # Prolong storage life on search
             cached_get_last_activity.clear() # Force sidebar refresh
-            query_vector = generate_embedding(query)
-            results = search_vectors(query_vector, session_id, limit=10)
+            results = search_documents(query, session_id, limit=10)
             
             if results:
                 doc_results = [res for res in results if res.payload.get("source_type") == "document"]
@@ -241,11 +240,8 @@ def main():
                 # RAG
                 if results:
                     # Combine document snippets and image descriptions for context
-                    context_text = "\n\n".join([
-                        f"[{res.payload.get('source_type', 'unknown')}] {res.payload.get('document', '')}" 
-                        for res in results[:RAG_CONTEXT_SIZE]
-                    ])
-                    answer = get_rag_answer(query, context_text)
+                    context_text = build_context_text(results)
+                    answer = get_rag_answer(query, context_text, session_id)
                     st.subheader("RAG Answer")
                     st.write(answer)
                 